@@ -106,7 +106,7 @@ async def notify_user(
 ):
     """Telefon orqali chat_id topib userga xabar yuboradi."""
     try:
-        tg_user = db.get_telegram_user(phone)
+        tg_user = await db.aio.get_telegram_user(phone)
         if not tg_user or not tg_user.get("chat_id"):
             return
         await ctx.bot.send_message(
@@ -271,7 +271,7 @@ async def notify_new_order(order: dict):
             reply_markup=admin_keyboard(order),
         )
         try:
-            db.update_tg_msg_id(order["id"], msg.message_id)
+            await db.aio.update_tg_msg_id(order["id"], msg.message_id)
         except Exception:
             pass
     except Exception as e:
@@ -342,7 +342,7 @@ async def cmd_start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     # User: ro'yxatdan o'tganmi?
-    existing = db.get_telegram_user_by_chat_id(str(chat_id))
+    existing = await db.aio.get_telegram_user_by_chat_id(str(chat_id))
     if existing:
         website = os.getenv("WEBSITE_URL", "https://kfs-menu.vercel.app/")
         first = (existing.get("full_name") or "").split()[0] or "do'st"
@@ -399,7 +399,7 @@ async def handle_contact(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     except Exception:
         pass
 
-    existing = db.get_telegram_user_by_chat_id(str(chat_id))
+    existing = await db.aio.get_telegram_user_by_chat_id(str(chat_id))
     if existing:
         first = (existing.get("full_name") or contact.first_name or "do'st").split()[0]
         await update.message.reply_text(
@@ -414,7 +414,7 @@ async def handle_contact(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return
 
     full_name = " ".join(filter(None, [contact.first_name, contact.last_name or ""])).strip()
-    db.save_telegram_user(phone=phone, chat_id=str(chat_id), full_name=full_name)
+    await db.aio.save_telegram_user(phone=phone, chat_id=str(chat_id), full_name=full_name)
 
     await update.message.reply_text(
         "✅ <b>Raqam saqlandi!</b>\n\nBuyurtma berish uchun tugmani bosing ⬇️",
@@ -442,7 +442,7 @@ async def handle_admin_status_callback(update: Update, ctx: ContextTypes.DEFAULT
 
     _, order_id, new_status = data.split(":", 2)
 
-    order = db.get_by_id(order_id)
+    order = await db.aio.get_by_id(order_id)
     if not order:
         await query.answer("❌ Zakaz topilmadi", show_alert=True)
         return
@@ -452,7 +452,7 @@ async def handle_admin_status_callback(update: Update, ctx: ContextTypes.DEFAULT
         await query.answer("⚠️ Status ketma-ketligi xato", show_alert=True)
         return
 
-    updated = db.update_status(order_id, new_status)
+    updated = await db.aio.update_status(order_id, new_status)
     if not updated:
         await query.answer("❌ Yangilab bo'lmadi", show_alert=True)
         return
@@ -524,7 +524,7 @@ async def courier_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     _, order_id, action = data.split(":", 2)
 
-    order = db.get_by_id(order_id)
+    order = await db.aio.get_by_id(order_id)
     if not order:
         await query.answer("❌ Zakaz topilmadi", show_alert=True)
         return
@@ -537,7 +537,7 @@ async def courier_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             await query.answer("⚠️ Status ketma-ketligi xato", show_alert=True)
             return
 
-        updated = db.update_status(order_id, "delivering") or order
+        updated = await db.aio.update_status(order_id, "delivering") or order
 
         # courier markup update
         try:
@@ -575,7 +575,7 @@ async def courier_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             await query.answer("⚠️ Status ketma-ketligi xato", show_alert=True)
             return
 
-        updated = db.update_status(order_id, "done") or order
+        updated = await db.aio.update_status(order_id, "done") or order
 
         # courier confirmation
         try:
@@ -611,7 +611,7 @@ async def courier_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
             new_balance = 0
             try:
-                new_balance = db.add_coins(phone=phone, amount=earned, order_id=order_id)
+                new_balance = await db.aio.add_coins(phone=phone, amount=earned, order_id=order_id)
             except Exception as e:
                 print(f"db.add_coins xato: {e}")
 
@@ -682,14 +682,13 @@ async def handle_review_text(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 # Admin commands / stats button
 # ═══════════════════════════════════════════════════════════════
 
-async def cmd_orders(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    if not _is_admin(update.effective_chat.id):
-        return
+ORDERS_PAGE_SIZE = 10
+
 
-    orders = db.get_all(limit=10)
+async def _orders_page(cursor: str | None = None) -> tuple[str, InlineKeyboardMarkup | None]:
+    orders, next_cursor = await db.aio.get_page(limit=ORDERS_PAGE_SIZE, cursor=cursor)
     if not orders:
-        await update.message.reply_text("📭 Hali zakaz yo'q.")
-        return
+        return ("📭 Hali zakaz yo'q." if not cursor else "📭 Boshqa zakaz yo'q."), None
 
     lines = []
     for o in orders:
@@ -697,16 +696,50 @@ async def cmd_orders(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         emoji, label = STATUS.get(st, ("🕐", st))
         lines.append(f"{emoji} #{o.get('id','—')} — {int(o.get('total',0) or 0):,} UZS — {label}")
 
-    await update.message.reply_text(
-        "📋 <b>Oxirgi zakazlar:</b>\n\n" + "\n".join(lines),
-        parse_mode="HTML",
-    )
+    title = "📋 <b>Oxirgi zakazlar:</b>" if not cursor else "📋 <b>Oldingi zakazlar:</b>"
+    markup = None
+    # callback_data Telegramda 64 baytgacha
+    if next_cursor and len(f"orders:{next_cursor}".encode()) <= 64:
+        markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("Keyingi ▶️", callback_data=f"orders:{next_cursor}")
+        ]])
+    return title + "\n\n" + "\n".join(lines), markup
+
+
+async def cmd_orders(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update.effective_chat.id):
+        return
+
+    text, markup = await _orders_page()
+    await update.message.reply_text(text, parse_mode="HTML", reply_markup=markup)
+
+
+async def orders_page_callback(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    data = query.data or ""
+
+    if not _is_admin(update.effective_chat.id):
+        await query.answer("❌ Ruxsat yo'q", show_alert=True)
+        return
+
+    cursor = data.split(":", 1)[1]
+    try:
+        text, markup = await _orders_page(cursor)
+    except ValueError:
+        await query.answer("⚠️ Sahifa eskirgan", show_alert=True)
+        return
+
+    await query.answer()
+    try:
+        await query.edit_message_text(text=text, parse_mode="HTML", reply_markup=markup)
+    except Exception as e:
+        print(f"Orders sahifa xato: {e}")
 
 
 async def cmd_stats(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if not _is_admin(update.effective_chat.id):
         return
-    s = db.stats_today()
+    s = await db.aio.stats_today()
     await update.message.reply_text(
         f"📊 <b>Bugungi statistika</b>\n\n"
         f"📦 Jami zakazlar : {s.get('total',0)}\n"
@@ -722,7 +755,7 @@ async def handle_statistics_btn(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if not _is_admin(update.effective_chat.id):
         return
 
-    s = db.stats_monthly()
+    s = await db.aio.stats_monthly()
     lines = [
         f"📊 <b>Oylik statistika — {s.get('month_label','')}</b>\n",
         f"📦 Jami zakazlar : <b>{s.get('total',0)}</b>",
@@ -790,6 +823,7 @@ def create_app() -> Application:
 
     # callbacks
     app.add_handler(CallbackQueryHandler(review_callback, pattern=r"^review:"))
+    app.add_handler(CallbackQueryHandler(orders_page_callback, pattern=r"^orders:"))
     app.add_handler(CallbackQueryHandler(courier_callback, pattern=r"^courier:"))
     app.add_handler(CallbackQueryHandler(handle_admin_status_callback, pattern=r"^status:"))
 
@@ -7,11 +7,34 @@ database.py — JSON fayllar orqali data saqlash (Railway Volume ready)
 
 ✅ Order counter reset bo‘lmaydi:
 - order_counter.json + orders.json dagi eng katta ID bilan sync qiladi
+
+✅ Zakazlar uchun storage tanlanadi (STORAGE_BACKEND):
+- json   → orders.json snapshot + orders.log.jsonl (append-only, default)
+- sqlite → kfc.db (WAL). Bo‘sh bazaga orders.json avtomatik import qilinadi,
+  qo‘lda: `python database.py import-orders`
+
+✅ Group commit: DB_COMMIT_WINDOW_MS ichidagi yozuvlar bitta fsync bilan diskka tushadi
+
+✅ Bir nechta worker (uvicorn --workers N): har lock fcntl.flock (<fayl>.lock) bilan birga,
+  keshlar fayl o‘zgarganini sezadi, zakazlar logi boshqa workerlardan tail qilinadi
 """
 
+import asyncio
+import base64
+import bisect
+import functools
+import gzip
+import heapq
+import itertools
 import json
 import os
+import re
+import sqlite3
 import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
@@ -30,21 +53,328 @@ DB_FILE = Path(os.getenv("DB_FILE", str(DATA_DIR / "orders.json"))).resolve()
 #  ATOMIC WRITE helper
 # ═══════════════════════════════════════════════════════════════
 
-def _atomic_write(path: Path, content: str) -> None:
+def _atomic_write(path: Path, content: str | bytes, durable: bool = False) -> None:
     """
     Atomik yozish (yarim yozilib qolishdan saqlaydi).
     Windows/Linux mos.
+    durable=True — fsync: qaytgandan keyin elektr o‘chsa ham yozuv yo‘qolmaydi.
     """
     tmp = path.with_suffix(path.suffix + ".tmp")
-    tmp.write_text(content, encoding="utf-8")
+    data = content if isinstance(content, bytes) else content.encode("utf-8")
+    with tmp.open("wb") as f:
+        f.write(data)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
     tmp.replace(path)
+    if durable and hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  PROCESS LOCK (bir nechta uvicorn worker uchun)
+# ═══════════════════════════════════════════════════════════════
+#
+# threading.Lock faqat bitta process ichida himoya qiladi. `--workers N` bilan har worker
+# o‘z xotirasiga ega, fayllar esa umumiy — shuning uchun har lock yonida <fayl>.lock
+# ustida fcntl.flock ham olinadi. fcntl yo‘q joyda (Windows) faqat thread lock qoladi.
+
+try:
+    import fcntl
+except ImportError:  # Windows — bitta worker bilan ishlatiladi
+    fcntl = None
+
+
+class _ProcessLock:
+    """
+    threading.Lock + <fayl>.lock ustida flock(LOCK_EX): `with lock:` bilan ishlatiladi.
+    pin() — thread lock bo‘shagandan keyin ham flock ushlab turiladi (group commit’da
+    diskka tushmagan yozuv bor ekan, boshqa worker eski faylni o‘qib ustidan yozmasin).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path.with_name(path.name + ".lock")
+        self._thread = threading.Lock()
+        self._fd: int | None = None
+        self._pid = 0
+        self._held = False
+        self._pins = 0
+
+    def _flock(self) -> None:
+        if fcntl is None or self._held:
+            return
+        if self._fd is None or self._pid != os.getpid():  # fork’dan keyin o‘z fd’imiz kerak
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._held = True
+
+    def _funlock(self) -> None:
+        if self._held:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._held = False
+
+    def acquire(self) -> None:
+        self._thread.acquire()
+        try:
+            self._flock()
+        except BaseException:
+            self._thread.release()
+            raise
+
+    def release(self) -> None:
+        if not self._pins:
+            self._funlock()
+        self._thread.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def pin(self) -> None:
+        # lock ostida chaqiriladi
+        self._pins += 1
+
+    def unpin(self) -> None:
+        # lock ostida chaqiriladi; flock release() da bo‘shaydi
+        self._pins -= 1
+
+
+def try_acquire_leadership(name: str):
+    """
+    Non-blocking flock: faqat bitta worker oladi (masalan bot polling).
+    Olingan bo‘lsa ochiq fayl qaytadi — process tirik ekan lock ushlanadi; aks holda None.
+    fcntl yo‘q bo‘lsa (bitta worker) doim lider.
+    """
+    f = (DATA_DIR / f"{name}.lock").open("a+")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
 
 
 # ═══════════════════════════════════════════════════════════════
-#  ORDERS (orders.json)
+#  GROUP COMMIT (yozuvlarni bitta diskka yozishga yig‘ish)
 # ═══════════════════════════════════════════════════════════════
+#
+# Tushlik paytidagi ko‘p yozuvlar har biri alohida fsync qilmasin:
+# DB_COMMIT_WINDOW_MS ichida kelgan o‘zgarishlar bitta atomik yozuv bo‘lib tushadi.
+# Chaqiruvchi ticket.wait() dan keyingina javob qaytaradi — ya’ni batch diskda.
+# DB_COMMIT_WINDOW_MS=0 → har yozuv darhol (chaqiruvchi thread’ida).
 
-_lock = threading.Lock()  # bir vaqtda yozishdan himoya
+COMMIT_WINDOW = float(os.getenv("DB_COMMIT_WINDOW_MS", "2")) / 1000
+
+
+class _Ticket:
+    """Bitta yozuv uchun kvitansiya: wait() batch diskka tushguncha kutadi."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._error: BaseException | None = None
+
+    def _finish(self, error: BaseException | None = None) -> None:
+        self._error = error
+        self._done.set()
+
+    def wait(self) -> None:
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+
+
+class _GroupCommit:
+    """
+    submit() fayl lock’i ostida chaqiriladi, ticket.wait() esa lock’dan keyin.
+    Fon thread oyna tugagach lock ostida flush(batch) qiladi.
+    pending — hali diskka tushmagan yozuvlar: loaderlar avval shuni ko‘radi.
+    pending bo‘sh emas ekan lock pin() qilingan — boshqa workerlar flush’ni kutadi.
+    """
+
+    def __init__(self, name: str, lock: "_ProcessLock", flush, window: float = COMMIT_WINDOW):
+        self.name = name
+        self.lock = lock
+        self.flush = flush
+        self.window = window
+        self.pending: list = []
+        self._tickets: list[_Ticket] = []
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, item) -> _Ticket:
+        ticket = _Ticket()
+        if self.window <= 0:
+            try:
+                self.flush([item])
+            except Exception as e:
+                ticket._finish(e)
+            else:
+                ticket._finish()
+            return ticket
+
+        if not self.pending and hasattr(self.lock, "pin"):
+            self.lock.pin()
+        self.pending.append(item)
+        self._tickets.append(ticket)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"commit-{self.name}", daemon=True)
+            self._thread.start()
+        self._wake.set()
+        return ticket
+
+    def drain(self) -> None:
+        """Lock ostida: kutayotgan batchni hoziroq yozadi."""
+        batch, tickets = self.pending, self._tickets
+        self.pending, self._tickets = [], []
+        if not batch:
+            return
+        if hasattr(self.lock, "unpin"):
+            self.lock.unpin()  # flock lock’dan chiqishda bo‘shaydi
+        error = None
+        try:
+            self.flush(batch)
+        except Exception as e:
+            error = e
+        for t in tickets:
+            t._finish(error)
+        if error is not None:
+            raise error
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            time.sleep(self.window)
+            with self.lock:
+                self._wake.clear()
+                try:
+                    self.drain()
+                except Exception as e:
+                    print(f"{self.name} commit xato: {e}")
+
+
+# ═══════════════════════════════════════════════════════════════
+#  JSON FILE CACHE (path + inode/size/mtime)
+# ═══════════════════════════════════════════════════════════════
+#
+# Loaderlar faylni faqat o‘zgarganda qayta parse qiladi. Kalit — (inode, size, mtime_ns).
+# Kalit yangi yozilgan fayl uchun ishonchsiz: mtime kernelning "coarse" soatidan olinadi
+# (bir tick ichidagi yozuvlar bir xil mtime oladi), ext4 esa atomik replace’da inode’ni
+# qayta ishlatadi — boshqa worker shu tick’da bir xil o‘lchamli fayl yozsa, kalit mos
+# kelib eski balans o‘qiladi. Shuning uchun diskdan o‘qilgan, mtime’i _RACY_NS dan yangi
+# kalit keshga yozilmaydi (git’dagi "racy clean" kabi): bunday fayl qayta parse qilinadi.
+# O‘z yozuvimiz (_write_json_file, fayl lock’i ostida) esa haqiqiy kalit bilan saqlanadi —
+# aks holda har yozuvdan keyin parse va identity’ga bog‘liq indekslar qayta qurilardi.
+# Qaytgan obyekt umumiy — faqat lock ostida, saqlash bilan birga o‘zgartiriladi;
+# o‘quvchilar uni o‘zgartirmaydi.
+
+_RACY_NS = 100_000_000  # 100 ms — ext4/xfs/btrfs timestamp tick’idan ancha katta
+
+_json_cache: dict[Path, tuple[tuple | None, object]] = {}
+
+
+def _file_key(path: Path) -> tuple | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _cache_key(key: tuple | None) -> tuple | None:
+    """Keshga yoziladigan kalit: fayl hali "racy" bo‘lsa None — hech qachon hit bo‘lmaydi."""
+    if key is None or time.time_ns() - key[2] < _RACY_NS:
+        return None
+    return key
+
+
+def _read_json_cached(path: Path, default=list):
+    key = _file_key(path)
+    if key is None:
+        return default()
+    hit = _json_cache.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return default()
+    _json_cache[path] = (_cache_key(key), data)
+    return data
+
+
+def _file_ino(path: Path) -> int | None:
+    key = _file_key(path)
+    return key[0] if key else None
+
+
+def _write_json_file(path: Path, data, durable: bool = True) -> None:
+    """Yozadi va keshni yangi kalit bilan yangilaydi (o‘z yozuvimizni qayta parse qilmaymiz)."""
+    try:
+        _atomic_write(path, json.dumps(data, ensure_ascii=False, indent=2), durable=durable)
+    except Exception:
+        _json_cache.pop(path, None)  # xotiradagi o‘zgarish diskka tushmadi
+        raise
+    _json_cache[path] = (_file_key(path), data)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  STORAGE BACKEND (STORAGE_BACKEND=json | sqlite)
+# ═══════════════════════════════════════════════════════════════
+#
+# json   — eski xulq: orders.json (default)
+# sqlite — kfc.db (WAL), id/status/phone/created_at bo‘yicha indekslangan
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+SQLITE_FILE = Path(os.getenv("SQLITE_FILE", str(DATA_DIR / "kfc.db"))).resolve()
+
+if STORAGE_BACKEND not in ("json", "sqlite"):
+    raise ValueError(f"Noma'lum STORAGE_BACKEND: {STORAGE_BACKEND!r} (json | sqlite)")
+
+
+def _prefix_upper(prefix: str) -> str:
+    """'2026-10' → '2026-11': created_at LIKE 'prefix%' ni indeks diapazoniga aylantiradi."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  ORDERS — JSON engine (orders.json snapshot + orders.log.jsonl)
+# ═══════════════════════════════════════════════════════════════
+#
+# Har o‘zgarish orders.log.jsonl ga bitta qator bo‘lib qo‘shiladi (O(record)):
+#   {"op": "created",        "order": {...}}
+#   {"op": "status_changed", "id": "0007", "status": "done"}
+#   {"op": "tg_msg_id_set",  "id": "0007", "tg_msg_id": 123}
+# Fon thread vaqti-vaqti bilan snapshot (orders.json) yozib logni qisqartiradi.
+# Startupda: snapshot + log replay. Replay idempotent — crash bo‘lsa ham xavfsiz.
+#
+# Oylik partitsiyalar: xotirada (hot) faqat joriy oy + hali yopilmagan zakazlar.
+# Yopilgan oylarning done/cancelled zakazlari compaction paytida
+# orders_archive/YYYY-MM.json.gz ga ko‘chadi (faqat o‘qish uchun).
+# manifest.json har oy uchun son/status/telefon/kalit chegaralarini saqlaydi —
+# so‘rovlar keraksiz arxivlarni ochmaydi.
+
+DB_LOG_FILE = Path(os.getenv("DB_LOG_FILE", str(DB_FILE.with_suffix(".log.jsonl")))).resolve()
+_DB_LOG_OLD = DB_LOG_FILE.with_suffix(DB_LOG_FILE.suffix + ".1")  # compaction paytidagi eski log
+
+COMPACT_EVERY = int(os.getenv("DB_COMPACT_EVERY", "1000"))        # shuncha yozuvdan keyin
+COMPACT_INTERVAL = float(os.getenv("DB_COMPACT_INTERVAL", "300"))  # yoki shuncha sekundda
+
+ARCHIVE_DIR = Path(os.getenv("DB_ARCHIVE_DIR", str(DATA_DIR / "orders_archive"))).resolve()
+_ARCHIVE_MANIFEST = ARCHIVE_DIR / "manifest.json"
+ARCHIVE_CACHE_SIZE = int(os.getenv("DB_ARCHIVE_CACHE", "2"))  # xotirada ochiq turadigan arxivlar
+_ARCHIVABLE = ("done", "cancelled")
+
+_lock = _ProcessLock(DB_FILE)  # bir vaqtda yozishdan himoya (workerlar orasida ham)
+_compact_lock = _ProcessLock(DB_FILE.with_name(DB_FILE.name + ".compact"))
 
 
 def _load() -> list[dict]:
@@ -56,99 +386,1069 @@ def _load() -> list[dict]:
         return []
 
 
-def _save(orders: list[dict]) -> None:
-    _atomic_write(DB_FILE, json.dumps(orders, ensure_ascii=False, indent=2))
+def _save(orders: list[dict], durable: bool = False) -> None:
+    _atomic_write(DB_FILE, json.dumps(orders, ensure_ascii=False, separators=(",", ":")), durable=durable)
+
+
+def _read_log(path: Path) -> list[dict]:
+    """Log qatorlarini o‘qiydi. Chala yozilgan (crash) qatorlar tashlab yuboriladi."""
+    return _read_log_from(path, 0)[0]
+
+
+def _read_log_from(path: Path, start: int) -> tuple[list[dict], int]:
+    """
+    start baytidan boshlab to‘liq qatorlarni o‘qiydi → (eventlar, keyingi o‘qish joyi).
+    Oxirgi qator "\n" siz bo‘lsa (crash) — o‘qish joyi undan oldin qoladi.
+    """
+    if not path.exists():
+        return [], 0
+    events = []
+    with path.open("rb") as f:
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            print(f"⚠️ {path.name}: buzilgan qator o‘tkazib yuborildi")
+    tail = data[end:].strip()
+    if tail and start == 0:
+        print(f"⚠️ {path.name}: buzilgan qator o‘tkazib yuborildi")
+    return events, start + end
+
+
+def _order_key(o: dict) -> tuple[str, str]:
+    """Tartiblash kaliti: (created_at, id) — yangi zakazlar oxirida."""
+    return str(o.get("created_at") or ""), str(o.get("id") or "")
+
+
+def _remove_key(keys: list, key) -> None:
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+class _OrderIndex:
+    """
+    Zakazlar + ikkilamchi indekslar (hammasi _lock ostida o‘zgaradi):
+      by_id     — id → order
+      seq       — (created_at, id) bo‘yicha tartiblangan kalitlar
+      by_status — status → tartiblangan kalitlar
+      by_phone  — phone → tartiblangan kalitlar
+      days      — kun → status → [soni, summa]          (stats_today)
+      months    — oy → phone → user agregati             (stats_monthly)
+    Sahifa va jami soni ro‘yxat uzunligi/slice orqali olinadi, to‘liq skan yo‘q.
+    Agregatlar add/set_status/remove_many da yangilanadi, rebuild_stats() bilan qayta quriladi.
+    """
+
+    def __init__(self, orders: list[dict] | None = None):
+        self.orders: list[dict] = []
+        self.by_id: dict[str, dict] = {}
+        self.seq: list[tuple[str, str]] = []
+        self.by_status: dict[str, list] = {}
+        self.by_phone: dict[str, list] = {}
+        self.days: dict[str, dict[str, list[int]]] = {}
+        self.months: dict[str, dict[str, dict]] = {}
+        self.max_num = 0
+        for o in orders or []:
+            self.add(o)
+
+    def _tally(self, o: dict, status, sign: int) -> None:
+        created = str(o.get("created_at", ""))
+        total = int(o.get("total", 0) or 0)
+        day = self.days.setdefault(created[:10], {}).setdefault(status, [0, 0])
+        day[0] += sign
+        day[1] += sign * total
+
+        users = self.months.setdefault(created[:7], {})
+        phone = o.get("phone", "unknown")
+        u = users.get(phone)
+        if u is None:
+            u = users[phone] = {
+                "name":  (o.get("customer_name", "") or "").strip() or "—",
+                "phone": phone,
+                "n":     {},
+                "sum":   {},
+            }
+        u["n"][status] = u["n"].get(status, 0) + sign
+        u["sum"][status] = u["sum"].get(status, 0) + sign * total
+
+    def rebuild_stats(self) -> None:
+        self.days, self.months = {}, {}
+        for o in self.orders:
+            self._tally(o, o.get("status"), 1)
+
+    def add(self, o: dict) -> None:
+        key = _order_key(o)
+        self._tally(o, o.get("status"), 1)
+        self.orders.append(o)
+        self.by_id[o.get("id")] = o
+        bisect.insort(self.seq, key)
+        bisect.insort(self.by_status.setdefault(o.get("status"), []), key)
+        bisect.insort(self.by_phone.setdefault(o.get("phone"), []), key)
+        oid = str(o.get("id", "")).strip()
+        if oid.isdigit():
+            self.max_num = max(self.max_num, int(oid))
+
+    def remove_many(self, ids: set) -> None:
+        for oid in ids:
+            o = self.by_id.pop(oid, None)
+            if o is None:
+                continue
+            key = _order_key(o)
+            self._tally(o, o.get("status"), -1)
+            _remove_key(self.seq, key)
+            _remove_key(self.by_status.get(o.get("status"), []), key)
+            _remove_key(self.by_phone.get(o.get("phone"), []), key)
+        self.orders = [o for o in self.orders if o.get("id") not in ids]
+
+    def set_status(self, o: dict, status: str) -> None:
+        key = _order_key(o)
+        self._tally(o, o.get("status"), -1)
+        self._tally(o, status, 1)
+        _remove_key(self.by_status.get(o.get("status"), []), key)
+        o["status"] = status
+        bisect.insort(self.by_status.setdefault(status, []), key)
+
+    def _keys(self, status, phone) -> tuple[list, str | None, str | None]:
+        """Eng qisqa indeks ro‘yxati + (kerak bo‘lsa) qo‘shimcha filter maydoni."""
+        if status and phone:
+            by_st = self.by_status.get(status, [])
+            by_ph = self.by_phone.get(phone, [])
+            if len(by_ph) <= len(by_st):
+                return by_ph, "status", status
+            return by_st, "phone", phone
+        if status:
+            return self.by_status.get(status, []), None, None
+        if phone:
+            return self.by_phone.get(phone, []), None, None
+        return self.seq, None, None
+
+    def page(self, status, phone, limit, offset, before=None) -> list[dict]:
+        """Yangidan eskiga. before=(created_at, id) — keyset cursor: shu kalitdan oldingilar."""
+        keys, field, want = self._keys(status, phone)
+        stop = bisect.bisect_left(keys, before) if before else len(keys)
+        if field is None:
+            end = max(stop - offset, 0)
+            picked = keys[max(end - limit, 0): end][::-1]
+        else:
+            matches = (keys[i] for i in range(stop - 1, -1, -1) if self.by_id[keys[i][1]].get(field) == want)
+            picked = list(itertools.islice(matches, offset, offset + limit))
+        return [self.by_id[k[1]] for k in picked]
+
+    def iter_desc(self, status, phone, before=None):
+        """(kalit, order) juftlari, yangidan eskiga — partitsiyalarni birlashtirish uchun."""
+        keys, field, want = self._keys(status, phone)
+        stop = bisect.bisect_left(keys, before) if before else len(keys)
+        for i in range(stop - 1, -1, -1):
+            o = self.by_id[keys[i][1]]
+            if field is None or o.get(field) == want:
+                yield keys[i], o
+
+    def count(self, status, phone) -> int:
+        keys, field, want = self._keys(status, phone)
+        if field is None:
+            return len(keys)
+        return sum(1 for k in keys if self.by_id[k[1]].get(field) == want)
+
+
+def _apply_event(index: _OrderIndex, ev: dict) -> None:
+    op = ev.get("op")
+    if op == "created":
+        o = ev.get("order") or {}
+        if o.get("id") in index.by_id:
+            return
+        o = dict(o)
+        if ev.get("coins_debit"):
+            o["coins_debit"] = int(ev["coins_debit"])
+        index.add(o)
+    elif op == "status_changed":
+        o = index.by_id.get(ev.get("id"))
+        if o is not None:
+            index.set_status(o, ev.get("status"))
+    elif op == "tg_msg_id_set":
+        o = index.by_id.get(ev.get("id"))
+        if o is not None:
+            o["tg_msg_id"] = ev.get("tg_msg_id")
+    elif op == "coins_debit_cleared":
+        for oid in ev.get("ids") or []:
+            o = index.by_id.get(oid)
+            if o is not None:
+                o.pop("coins_debit", None)
+
+
+def _read_json_orders() -> tuple[_OrderIndex, int, int]:
+    """
+    Snapshot + (eski log) + log → (indeks, replay qilingan yozuvlar soni, logning o‘qilgan oxiri).
+    _lock ostida. Snapshot’ni boshqa worker compaction’da lock’siz almashtiradi va keyin .1 ni
+    o‘chiradi — o‘qish davomida snapshot o‘zgargan bo‘lsa, qaytadan o‘qiymiz.
+    """
+    while True:
+        snap = _file_key(DB_FILE)
+        orders = _load()
+        old = _read_log(_DB_LOG_OLD)
+        if _file_key(DB_FILE) == snap:
+            break
+    tail, pos = _read_log_from(DB_LOG_FILE, 0)
+    index = _OrderIndex(orders)
+    events = old + tail
+    for ev in events:
+        _apply_event(index, ev)
+    return index, len(events), pos
+
+
+def _month_of(o: dict) -> str:
+    m = str(o.get("created_at") or "")[:7]
+    return m if len(m) == 7 and m[4] == "-" and (m[:4] + m[5:]).isdigit() else ""
+
+
+def _manifest_load() -> dict:
+    if _ARCHIVE_MANIFEST.exists():
+        try:
+            return json.loads(_ARCHIVE_MANIFEST.read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+    return {}
+
+
+def _archive_path(month: str) -> Path:
+    return ARCHIVE_DIR / f"{month}.json.gz"
+
+
+def _archive_read(month: str) -> list[dict]:
+    path = _archive_path(month)
+    if not path.exists():
+        return []
+    return json.loads(gzip.decompress(path.read_bytes()).decode("utf-8"))
+
+
+def _archive_meta(orders: list[dict]) -> dict:
+    """Arxiv oyining qisqa tavsifi: so‘rovlar shu bo‘yicha arxivni ochmasdan o‘tkazib yuboradi."""
+    by_status: dict[str, int] = {}
+    phones: dict[str, dict[str, int]] = {}
+    nums = []
+    non_numeric = False
+    for o in orders:
+        st = o.get("status")
+        by_status[st] = by_status.get(st, 0) + 1
+        ph = phones.setdefault(o.get("phone"), {})
+        ph[st] = ph.get(st, 0) + 1
+        oid = str(o.get("id", "")).strip()
+        if oid.isdigit():
+            nums.append(int(oid))
+        else:
+            non_numeric = True
+    keys = [_order_key(o) for o in orders]
+    return {
+        "count":       len(orders),
+        "by_status":   by_status,
+        "phones":      phones,
+        "min_key":     list(min(keys)) if keys else None,
+        "max_key":     list(max(keys)) if keys else None,
+        "min_num":     min(nums) if nums else None,
+        "max_num":     max(nums) if nums else None,
+        "non_numeric": non_numeric,
+    }
+
+
+def _archive_write(month: str, orders: list[dict], manifest: dict) -> None:
+    """
+    Oy arxiviga qo‘shadi (id bo‘yicha birlashtiradi — qayta arxivlash idempotent).
+    Arxiv va manifest fsync bilan: shundan keyingina zakazlar hot’dan olinadi.
+    """
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    merged = {o.get("id"): o for o in _archive_read(month)}
+    for o in orders:
+        merged[o.get("id")] = dict(o)
+    rows = sorted(merged.values(), key=_order_key)
+    raw = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    _atomic_write(_archive_path(month), gzip.compress(raw), durable=True)
+    manifest[month] = _archive_meta(rows)
+    _atomic_write(_ARCHIVE_MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2), durable=True)
+
+
+def _archive_count(meta: dict, status, phone) -> int:
+    if phone:
+        by_st = (meta.get("phones") or {}).get(phone) or {}
+        return by_st.get(status, 0) if status else sum(by_st.values())
+    if status:
+        return (meta.get("by_status") or {}).get(status, 0)
+    return int(meta.get("count", 0))
+
+
+class _JsonOrderStore:
+    """
+    Hot partitsiya bir marta yuklanib xotirada turadi: id bo‘yicha dict — O(1).
+    Yozish = log ga bitta qator qo‘shish, keyin xotiraga qo‘llash.
+    Arxiv oylari kerak bo‘lganda ochiladi (LRU), faqat o‘qish uchun.
+    Tashqariga nusxa (dict(o)) qaytariladi, ichki holat buzilmasin.
+    """
+
+    def __init__(self):
+        self._index: _OrderIndex | None = None
+        self._manifest: dict = {}
+        self._archives: OrderedDict[str, _OrderIndex] = OrderedDict()
+        self._log = None
+        self._log_records = 0
+        # boshqa workerlar bilan sinxron: log qayergacha o‘qilgan, qaysi log/snapshot
+        self._log_pos = 0
+        self._log_ino: int | None = None
+        self._snap_key: tuple | None = None
+        self._commit = _GroupCommit("orders", _lock, self._flush_log)
+        self._wake = threading.Event()
+        self._compactor: threading.Thread | None = None
+
+    def _ensure(self) -> _OrderIndex:
+        # _lock ostida chaqiriladi
+        if self._index is not None:
+            self._sync()
+        if self._index is None:
+            # hali diskka tushmagan o‘z yozuvlarimiz qayta yuklashda yo‘qolmasin
+            self._commit.drain()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._snap_key = _file_key(DB_FILE)
+            self._log_ino = _file_ino(DB_LOG_FILE)
+            self._index, self._log_records, self._log_pos = _read_json_orders()
+            self._manifest = _manifest_load()
+            self._archives.clear()
+            # arxivlash crash bilan chala qolgan bo‘lsa, hot’dagi nusxalar shu yerda tozalanadi
+            if self._archive_closed():
+                self._log_records += 1
+        if self._compactor is None:
+            self._compactor = threading.Thread(target=self._compact_loop, name="orders-compactor", daemon=True)
+            self._compactor.start()
+        return self._index
+
+    def preload(self) -> None:
+        with _lock:
+            self._ensure()
+
+    def _sync(self) -> None:
+        """
+        _lock ostida: boshqa workerlar logga qo‘shgan qatorlarni xotiraga qo‘llaydi.
+        Log aylangan (compaction) yoki snapshot almashgan bo‘lsa — to‘liq qayta yuklash.
+        """
+        key = _file_key(DB_LOG_FILE)
+        if (key[0] if key else None) != self._log_ino or _file_key(DB_FILE) != self._snap_key:
+            self._index = None
+            return
+        if key and key[1] > self._log_pos:
+            events, self._log_pos = _read_log_from(DB_LOG_FILE, self._log_pos)
+            for ev in events:
+                _apply_event(self._index, ev)
+            self._log_records += len(events)
+
+    # ── log ─────────────────────────────────────────────────────
+
+    def _append(self, ev: dict) -> _Ticket:
+        """
+        _lock ostida: xotiraga qo‘llaydi va qatorni group commit’ga beradi.
+        Chaqiruvchi lock’dan chiqib ticket.wait() qiladi — javob faqat fsync’dan keyin.
+        """
+        ev["at"] = datetime.utcnow().isoformat()
+        _apply_event(self._index, ev)
+        self._log_records += 1
+        if self._log_records >= COMPACT_EVERY:
+            self._wake.set()
+        return self._commit.submit(json.dumps(ev, ensure_ascii=False) + "\n")
+
+    def _flush_log(self, lines: list[str]) -> None:
+        # _lock ostida: butun batch — bitta write + bitta fsync
+        if self._log is None:
+            self._log = DB_LOG_FILE.open("ab")
+        pos = os.fstat(self._log.fileno()).st_size
+        try:
+            self._log.write("".join(lines).encode("utf-8"))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            st = os.fstat(self._log.fileno())
+            self._log_ino, self._log_pos = st.st_ino, st.st_size
+        except Exception:
+            # chala qator keyingi yozuvni buzmasin; xotira diskdagi holatdan qayta yuklanadi
+            self._log.close()
+            self._log = None
+            with DB_LOG_FILE.open("r+b") as f:
+                f.truncate(pos)
+            self._index = None
+            raise
+
+    def _rotate_log(self) -> None:
+        # _lock ostida: joriy log → .1 (oldingi compaction tugamagan bo‘lsa, unga qo‘shiladi)
+        self._commit.drain()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        self._log_ino, self._log_pos = None, 0
+        if not DB_LOG_FILE.exists():
+            return
+        if _DB_LOG_OLD.exists():
+            with _DB_LOG_OLD.open("a", encoding="utf-8") as old:
+                old.write(DB_LOG_FILE.read_text(encoding="utf-8"))
+            DB_LOG_FILE.unlink()
+        else:
+            DB_LOG_FILE.replace(_DB_LOG_OLD)
+
+    # ── partitsiyalar ───────────────────────────────────────────
+
+    def _archive_closed(self) -> bool:
+        """
+        _lock ostida: yopilgan oylarning done/cancelled zakazlarini arxivga ko‘chiradi.
+        Avval arxiv + manifest yoziladi, keyin hot’dan olinadi (snapshot compaction’da).
+        """
+        current = datetime.utcnow().strftime("%Y-%m")
+        by_month: dict[str, list[dict]] = {}
+        for o in self._index.orders:
+            m = _month_of(o)
+            if m and m < current and o.get("status") in _ARCHIVABLE:
+                by_month.setdefault(m, []).append(o)
+        for m, rows in sorted(by_month.items()):
+            _archive_write(m, rows, self._manifest)
+            self._archives.pop(m, None)
+            self._index.remove_many({o.get("id") for o in rows})
+            print(f"🗄 Zakazlar arxivlandi: {m} ({len(rows)} ta)")
+        return bool(by_month)
+
+    def _archive(self, month: str) -> _OrderIndex:
+        part = self._archives.get(month)
+        if part is None:
+            part = _OrderIndex(_archive_read(month))
+            self._archives[month] = part
+            while len(self._archives) > ARCHIVE_CACHE_SIZE:
+                self._archives.popitem(last=False)
+        self._archives.move_to_end(month)
+        return part
+
+    def _archives_for(self, status, phone, before) -> list[tuple[tuple, str]]:
+        """Mos keladigan arxiv oylari (max_key, oy) — eng yangisidan. Qolganlari ochilmaydi."""
+        out = []
+        for month, meta in self._manifest.items():
+            if not meta.get("max_key") or not _archive_count(meta, status, phone):
+                continue
+            if before and tuple(meta["min_key"]) >= before:
+                continue
+            out.append((tuple(meta["max_key"]), month))
+        out.sort(reverse=True)
+        return out
+
+    def _iter_desc(self, status, phone, before):
+        """
+        Hot + arxivlarni (created_at, id) bo‘yicha birlashtiradi, yangidan eskiga.
+        Arxiv faqat navbat unga yetganda ochiladi.
+        """
+        pending = self._archives_for(status, phone, before)
+        heads: list[list] = []
+
+        def push(it):
+            for key, o in it:
+                heads.append([key, o, it])
+                return
+
+        push(self._index.iter_desc(status, phone, before))
+        i = 0
+        while True:
+            best = max(range(len(heads)), key=lambda j: heads[j][0]) if heads else None
+            if i < len(pending) and (best is None or pending[i][0] >= heads[best][0]):
+                push(self._archive(pending[i][1]).iter_desc(status, phone, before))
+                i += 1
+                continue
+            if best is None:
+                return
+            _, o, it = heads.pop(best)
+            yield o
+            push(it)
+
+    def compact(self) -> None:
+        """
+        Yopilgan oylarni arxivlaydi, snapshot yozib logni tozalaydi.
+        Og‘ir qismi (json.dumps + yozish) lock’dan tashqarida:
+        lock ostida faqat log aylantiriladi va zakazlar nusxalanadi.
+        """
+        with _compact_lock:
+            with _lock:
+                index = self._ensure()
+                archived = self._archive_closed()
+                if not archived and not self._log_records and not _DB_LOG_OLD.exists():
+                    return
+                self._rotate_log()
+                snapshot = [dict(o) for o in index.orders]
+                self._log_records = 0
+            # snapshot diskka (fsync) tushmaguncha eski log o‘chirilmaydi — elektr o‘chsa
+            # yarim snapshot + yo‘q log = zakazlar yo‘qoladi
+            _save(snapshot, durable=True)
+            self._snap_key = _file_key(DB_FILE)  # o‘z snapshot’imiz — qayta yuklash shart emas
+            _DB_LOG_OLD.unlink(missing_ok=True)
+
+    def _compact_loop(self) -> None:
+        while True:
+            self._wake.wait(COMPACT_INTERVAL)
+            self._wake.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"orders compaction xato: {e}")
+
+    def close(self) -> None:
+        self.compact()
+        with _lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    # ── API ─────────────────────────────────────────────────────
+
+    def get_all(self, status, phone, limit, offset, before=None) -> list[dict]:
+        with _lock:
+            index = self._ensure()
+            if not self._archives_for(status, phone, before):
+                return [dict(o) for o in index.page(status, phone, limit, offset, before)]
+            rows = itertools.islice(self._iter_desc(status, phone, before), offset, offset + limit)
+            return [dict(o) for o in rows]
+
+    def get_by_id(self, order_id: str) -> dict | None:
+        with _lock:
+            o = self._ensure().by_id.get(order_id)
+            if o is None:
+                oid = str(order_id).strip()
+                num = int(oid) if oid.isdigit() else None
+                for month, meta in self._manifest.items():
+                    if num is None:
+                        hit = meta.get("non_numeric")
+                    else:
+                        hit = meta.get("min_num") is not None and meta["min_num"] <= num <= meta["max_num"]
+                    if hit:
+                        o = self._archive(month).by_id.get(order_id)
+                        if o is not None:
+                            break
+            return dict(o) if o else None
+
+    def create(self, order: dict, coins_debit: int = 0) -> dict:
+        with _lock:
+            if order.get("id") in self._ensure().by_id:
+                raise ValueError("DUPLICATE_ID")
+
+            _fill_order_defaults(order)
+            ev = {"op": "created", "order": order}
+            if coins_debit:
+                ev["coins_debit"] = int(coins_debit)
+            done = self._append(ev)
+
+        done.wait()
+        return order
+
+    def coin_debits(self) -> list[tuple[str, str, int]]:
+        """
+        Ledgerda tasdiqlanmagan place_order coin yechishlari: (id, phone, miqdor).
+        coins_debit zakaz yozuvida turadi — compaction uni snapshot’ga olib o‘tadi.
+        """
+        with _lock:
+            return [
+                (o.get("id"), o.get("phone"), int(o["coins_debit"]))
+                for o in self._ensure().orders
+                if o.get("coins_debit")
+            ]
+
+    def clear_coin_debits(self, order_ids: list[str]) -> None:
+        with _lock:
+            by_id = self._ensure().by_id
+            ids = [oid for oid in order_ids if by_id.get(oid, {}).get("coins_debit")]
+            if ids:
+                # kutilmaydi: yozuv yo‘qolsa, startup _ledger_has() bilan qayta tekshiradi
+                self._append({"op": "coins_debit_cleared", "ids": ids})
+
+    def update_status(self, order_id: str, status: str) -> dict | None:
+        with _lock:
+            index = self._ensure()
+            if order_id not in index.by_id:
+                return None
+            done = self._append({"op": "status_changed", "id": order_id, "status": status})
+            updated = dict(index.by_id[order_id])
+        done.wait()
+        return updated
+
+    def update_tg_msg_id(self, order_id: str, msg_id: int) -> None:
+        with _lock:
+            if order_id not in self._ensure().by_id:
+                return
+            done = self._append({"op": "tg_msg_id_set", "id": order_id, "tg_msg_id": msg_id})
+        done.wait()
+
+    def count(self, status, phone) -> int:
+        with _lock:
+            n = self._ensure().count(status, phone)
+            return n + sum(_archive_count(meta, status, phone) for meta in self._manifest.values())
+
+    # Joriy kun/oy doim hot partitsiyada — statistikaga arxiv kerak emas.
+
+    def stats_day(self, day: str) -> dict[str, list[int]]:
+        with _lock:
+            return {st: list(v) for st, v in self._ensure().days.get(day, {}).items()}
+
+    def stats_month(self, month: str) -> list[dict]:
+        with _lock:
+            users = self._ensure().months.get(month, {})
+            return [
+                {**u, "n": dict(u["n"]), "sum": dict(u["sum"])}
+                for u in users.values()
+                if sum(u["n"].values()) > 0
+            ]
+
+    def rebuild_stats(self) -> None:
+        with _lock:
+            self._ensure().rebuild_stats()
+
+    def max_order_number(self) -> int:
+        with _lock:
+            nums = [meta.get("max_num") or 0 for meta in self._manifest.values()]
+            return max([self._ensure().max_num, *nums])
+
+
+# ═══════════════════════════════════════════════════════════════
+#  ORDERS — SQLite engine (kfc.db, WAL)
+# ═══════════════════════════════════════════════════════════════
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id         TEXT PRIMARY KEY,
+    status     TEXT,
+    phone      TEXT,
+    created_at TEXT NOT NULL DEFAULT '',
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_orders_created ON orders(created_at, id);
+CREATE INDEX IF NOT EXISTS ix_orders_status  ON orders(status, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_orders_phone   ON orders(phone, created_at, id);
+
+-- kunlik agregatlar: zakaz yozilgan tranzaksiyaning o‘zida yangilanadi
+CREATE TABLE IF NOT EXISTS order_stats (
+    day    TEXT NOT NULL,
+    phone  TEXT NOT NULL,
+    status TEXT NOT NULL,
+    n      INTEGER NOT NULL DEFAULT 0,
+    total  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, phone, status)
+);
+CREATE TABLE IF NOT EXISTS order_stats_names (
+    month TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    name  TEXT NOT NULL,
+    PRIMARY KEY (month, phone)
+);
+
+-- place_order: zakaz bilan bir tranzaksiyada yoziladi; ledgerga tushgani startupda tekshiriladi
+CREATE TABLE IF NOT EXISTS coin_debits (
+    order_id TEXT PRIMARY KEY,
+    phone    TEXT NOT NULL,
+    amount   INTEGER NOT NULL
+);
+"""
+
+
+class _SqliteOrderStore:
+    """
+    kfc.db — har thread o‘z connection’i bilan ishlaydi.
+    WAL rejimi: o‘qishlar yozishni kutmaydi.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.executescript(_SQLITE_SCHEMA)
+                    self._ready = True
+                    empty = conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone() is None
+                    if empty and (DB_FILE.exists() or DB_LOG_FILE.exists()):
+                        n = import_orders_from_json(DB_FILE, store=self)
+                        if n:
+                            print(f"📥 orders.json → {self.path.name}: {n} ta zakaz import qilindi")
+                    no_stats = conn.execute("SELECT 1 FROM order_stats LIMIT 1").fetchone() is None
+                    if no_stats and conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone():
+                        self.rebuild_stats()
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row(o: dict) -> tuple:
+        return (
+            o.get("id"),
+            o.get("status"),
+            o.get("phone"),
+            str(o.get("created_at") or ""),
+            json.dumps(o, ensure_ascii=False),
+        )
+
+    @staticmethod
+    def _where(status, phone, before=None) -> tuple[str, list]:
+        clauses, args = [], []
+        if status:
+            clauses.append("status = ?")
+            args.append(status)
+        if phone:
+            clauses.append("phone = ?")
+            args.append(phone)
+        if before:
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            args.extend([before[0], before[0], before[1]])
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, o: dict, status, sign: int) -> None:
+        created = str(o.get("created_at", ""))
+        phone = o.get("phone", "unknown")
+        phone_key = "" if phone is None else phone
+        conn.execute(
+            "INSERT INTO order_stats (day, phone, status, n, total) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(day, phone, status) DO UPDATE SET n = n + excluded.n, total = total + excluded.total",
+            (created[:10], phone_key, status or "", sign, sign * int(o.get("total", 0) or 0)),
+        )
+        if sign > 0:
+            conn.execute(
+                "INSERT OR IGNORE INTO order_stats_names (month, phone, name) VALUES (?, ?, ?)",
+                (created[:7], phone_key, (o.get("customer_name", "") or "").strip() or "—"),
+            )
+
+    def rebuild_stats(self) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM order_stats")
+            conn.execute("DELETE FROM order_stats_names")
+            for (data,) in conn.execute("SELECT data FROM orders ORDER BY rowid").fetchall():
+                o = json.loads(data)
+                self._bump(conn, o, o.get("status"), 1)
+
+    def preload(self) -> None:
+        self._conn()
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def insert_many(self, orders: list[dict]) -> int:
+        n = 0
+        with self._tx() as conn:
+            for o in orders:
+                if not o.get("id"):
+                    continue
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO orders (id, status, phone, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                    self._row(o),
+                )
+                if cur.rowcount:
+                    self._bump(conn, o, o.get("status"), 1)
+                    n += 1
+        return n
+
+    def get_all(self, status, phone, limit, offset, before=None) -> list[dict]:
+        where, args = self._where(status, phone, before)
+        rows = self._conn().execute(
+            f"SELECT data FROM orders{where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            [*args, limit, offset],
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_by_id(self, order_id: str) -> dict | None:
+        row = self._conn().execute("SELECT data FROM orders WHERE id = ?", (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def create(self, order: dict, coins_debit: int = 0) -> dict:
+        _fill_order_defaults(order)
+        try:
+            with self._tx() as conn:
+                conn.execute(
+                    "INSERT INTO orders (id, status, phone, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                    self._row(order),
+                )
+                self._bump(conn, order, order.get("status"), 1)
+                if coins_debit:
+                    conn.execute(
+                        "INSERT INTO coin_debits (order_id, phone, amount) VALUES (?, ?, ?)",
+                        (order.get("id"), order.get("phone") or "", int(coins_debit)),
+                    )
+        except sqlite3.IntegrityError:
+            raise ValueError("DUPLICATE_ID")
+        return order
+
+    def coin_debits(self) -> list[tuple[str, str, int]]:
+        return [tuple(r) for r in self._conn().execute("SELECT order_id, phone, amount FROM coin_debits")]
+
+    def clear_coin_debits(self, order_ids: list[str]) -> None:
+        with self._tx() as conn:
+            conn.executemany("DELETE FROM coin_debits WHERE order_id = ?", [(oid,) for oid in order_ids])
+
+    def _patch(self, order_id: str, field: str, value) -> dict | None:
+        with self._tx() as conn:
+            row = conn.execute("SELECT data FROM orders WHERE id = ?", (order_id,)).fetchone()
+            if not row:
+                return None
+            o = json.loads(row[0])
+            if field == "status":
+                self._bump(conn, o, o.get("status"), -1)
+                self._bump(conn, o, value, 1)
+            o[field] = value
+            conn.execute(
+                "UPDATE orders SET status = ?, data = ? WHERE id = ?",
+                (o.get("status"), json.dumps(o, ensure_ascii=False), order_id),
+            )
+        return o
+
+    def update_status(self, order_id: str, status: str) -> dict | None:
+        return self._patch(order_id, "status", status)
+
+    def update_tg_msg_id(self, order_id: str, msg_id: int) -> None:
+        self._patch(order_id, "tg_msg_id", msg_id)
+
+    def count(self, status, phone) -> int:
+        where, args = self._where(status, phone)
+        return self._conn().execute(f"SELECT COUNT(*) FROM orders{where}", args).fetchone()[0]
+
+    def stats_day(self, day: str) -> dict[str, list[int]]:
+        rows = self._conn().execute(
+            "SELECT status, SUM(n), SUM(total) FROM order_stats WHERE day = ? GROUP BY status", (day,)
+        ).fetchall()
+        return {st: [int(n), int(total)] for st, n, total in rows}
+
+    def stats_month(self, month: str) -> list[dict]:
+        conn = self._conn()
+        users: dict[str, dict] = {}
+        for phone, name in conn.execute(
+            "SELECT phone, name FROM order_stats_names WHERE month = ? ORDER BY rowid", (month,)
+        ):
+            users[phone] = {"name": name, "phone": phone or None, "n": {}, "sum": {}}
+        for phone, st, n, total in conn.execute(
+            "SELECT phone, status, SUM(n), SUM(total) FROM order_stats "
+            "WHERE day >= ? AND day < ? GROUP BY phone, status",
+            (month, _prefix_upper(month)),
+        ):
+            u = users.setdefault(phone, {"name": "—", "phone": phone or None, "n": {}, "sum": {}})
+            u["n"][st] = int(n)
+            u["sum"][st] = int(total)
+        return [u for u in users.values() if sum(u["n"].values()) > 0]
+
+    def max_order_number(self) -> int:
+        row = self._conn().execute(
+            "SELECT MAX(CAST(id AS INTEGER)) FROM orders WHERE id != '' AND id NOT GLOB '*[^0-9]*'"
+        ).fetchone()
+        return int(row[0] or 0)
+
+
+def import_orders_from_json(path: Path = DB_FILE, store: "_SqliteOrderStore | None" = None) -> int:
+    """
+    Bir martalik import: orders.json (+ orders.log.jsonl) → SQLite.
+    Mavjud id lar o‘tkazib yuboriladi, shuning uchun qayta ishga tushirish xavfsiz.
+    """
+    store = store or (_orders if isinstance(_orders, _SqliteOrderStore) else _SqliteOrderStore(SQLITE_FILE))
+    if Path(path).resolve() == DB_FILE:
+        orders = _read_json_orders()[0].orders
+        for month in _manifest_load():
+            orders = orders + _archive_read(month)
+    else:
+        try:
+            orders = json.loads(Path(path).read_text(encoding="utf-8"))
+        except Exception:
+            return 0
+    return store.insert_many(orders)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  ORDERS — public API (main.py / bot.py shu funksiyalarni chaqiradi)
+# ═══════════════════════════════════════════════════════════════
+
+def _fill_order_defaults(order: dict) -> None:
+    order["created_at"] = order.get("created_at") or datetime.utcnow().isoformat()
+    order["status"] = order.get("status") or "pending"
+    order.setdefault("tg_msg_id", None)
+    order.setdefault("tg_user_id", None)
+
+
+_orders = _SqliteOrderStore(SQLITE_FILE) if STORAGE_BACKEND == "sqlite" else _JsonOrderStore()
+
+
+def warm_up() -> None:
+    """Startupda chaqiriladi: zakazlar bir marta yuklanadi, birinchi so‘rov kutmasin."""
+    _orders.preload()
+    with _counter_lock:
+        _counter_reconcile()
+    _coins_reconcile()
+    _coins_redo_debits()
+
+
+def shutdown() -> None:
+    """
+    To‘xtashda: JSON engine logni snapshotga yig‘adi (keyingi startup tezroq).
+    I/O pool yopiladi, lekin keyingi db.aio chaqiruvida qayta yaratiladi (ikkinchi lifespan).
+    Kutayotgan group commit’lar ham yoziladi — yozilmay qolsa, flock bo‘shagach boshqa
+    worker eski balansni o‘qib shu coinlarni qayta sarflaydi.
+    """
+    global _io_executor
+    with _io_executor_lock:
+        executor, _io_executor = _io_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    for commit in (_coins_commit, _tg_commit, _otp_commit, _users_commit):
+        with commit.lock:
+            commit.drain()
+    _orders.close()
+
+
+def encode_cursor(order: dict) -> str:
+    """Shaffof bo‘lmagan cursor: (created_at, id) → base64url."""
+    raw = json.dumps(list(_order_key(order)), ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, oid = json.loads(raw.decode("utf-8"))
+        return str(created_at), str(oid)
+    except Exception:
+        raise ValueError("BAD_CURSOR")
 
 
 def get_all(
     status: str | None = None,
     phone: str | None = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: str | None = None,
 ) -> list[dict]:
-    with _lock:
-        orders = _load()
+    before = _decode_cursor(cursor) if cursor else None
+    return _orders.get_all(status, phone, limit, offset, before)
 
-    if status:
-        orders = [o for o in orders if o.get("status") == status]
-    if phone:
-        orders = [o for o in orders if o.get("phone") == phone]
 
-    orders.sort(key=lambda o: o.get("created_at", ""), reverse=True)
-    return orders[offset: offset + limit]
+def get_page(
+    status: str | None = None,
+    phone: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    get_all + keyingi sahifa cursori (sahifa oxiri bo‘lsa None).
+    Cursor bilan har sahifa indeksdan O(log n + limit) — chuqurlikka bog‘liq emas.
+    """
+    if limit <= 0:
+        return [], None
+    orders = get_all(status, phone, limit + 1, offset, cursor)
+    if len(orders) > limit:
+        return orders[:limit], encode_cursor(orders[limit - 1])
+    return orders, None
 
 
 def get_by_id(order_id: str) -> dict | None:
-    with _lock:
-        orders = _load()
-    return next((o for o in orders if o.get("id") == order_id), None)
+    return _orders.get_by_id(order_id)
 
 
 def create(order: dict) -> dict:
-    with _lock:
-        orders = _load()
-        if any(o.get("id") == order.get("id") for o in orders):
-            raise ValueError("DUPLICATE_ID")
+    created = _orders.create(order)
+    _counter_observe(created.get("id"))
+    return created
 
-        order["created_at"] = order.get("created_at") or datetime.utcnow().isoformat()
-        order["status"] = order.get("status") or "pending"
-        order.setdefault("tg_msg_id", None)
-        order.setdefault("tg_user_id", None)
 
-        orders.append(order)
-        _save(orders)
-
-    return order
+def place_order(order: dict, coins_used: int = 0) -> dict:
+    """
+    Checkout: balans tekshiruvi + raqam berish + zakaz + coin yechish bitta amal.
+    Coin ishlatilmasa — oddiy create(): _coins_lock olinmaydi, parallel zakazlar bitta
+    group commit’ga tushadi.
+    Coin bilan: zakaz yozuvi coin yechishni ham saqlaydi (coins_debit) va durable yoziladi,
+    keyin coin balansdan ayiriladi. Ledger yozuvi lock’dan tashqarida kutiladi: diskka
+    tushgach zakazdagi coins_debit tozalanadi; tushmasa xato chaqiruvchiga ko‘tariladi,
+    coins_debit esa zakaz yozuvida (va snapshot’da) qoladi — warm_up() uni qayta qo‘llaydi.
+    Raqam lock’dan oldin olinadi; _coins_lock faqat balans tekshiruvi + zakaz yozuvi +
+    yechish davomida ushlanadi — bir telefondan parallel zakazlar bitta balansni ikki marta
+    sarflay olmaydi. Balans yetmasa ValueError("Yetarli coin yo'q"), zakaz yaratilmaydi.
+    """
+    coins_used = int(coins_used or 0)
+    if coins_used <= 0:
+        order["id"] = order_id_from_number(next_order_number())
+        return _orders.create(order)
+
+    phone = order.get("phone")
+    # lock’siz oldindan tekshiruv — yetmasa raqam behuda band qilinmaydi
+    if not phone or get_coins(phone) < coins_used:
+        raise ValueError("Yetarli coin yo'q")
+    order["id"] = order_id_from_number(next_order_number())
+    with _coins_lock:
+        rec = _coins_indexed()[1].get(phone)
+        if not rec or int(rec.get("balance", 0) or 0) < coins_used:
+            raise ValueError("Yetarli coin yo'q")
+        created = _orders.create(order, coins_debit=coins_used)
+        _, done = _coins_apply(phone, coins_used, "spend", created["id"])
+    done.wait()
+    _orders.clear_coin_debits([created["id"]])
+    return created
+
+
+def _coins_redo_debits() -> None:
+    """Startupda: zakaz yozuvida bor, lekin ledgerga tushmay qolgan coin yechishlarini qo‘llaydi."""
+    debits = _orders.coin_debits()
+    if not debits:
+        return
+    redone, done = [], None
+    with _coins_lock:
+        for order_id, phone, amount in debits:
+            if _ledger_has(phone, order_id):
+                continue
+            try:
+                _, done = _coins_apply(phone, amount, "spend", order_id)
+                redone.append(order_id)
+            except ValueError:
+                print(f"⚠️ #{order_id}: coin yechib bo‘lmadi (balans yetmaydi)")
+    if done is not None:
+        done.wait()
+        print(f"🪙 Zakazlardan coin yechish qayta qo‘llandi: {', '.join(redone)}")
+    _orders.clear_coin_debits([d[0] for d in debits])
 
 
 def update_status(order_id: str, status: str) -> dict | None:
-    with _lock:
-        orders = _load()
-        for o in orders:
-            if o.get("id") == order_id:
-                o["status"] = status
-                _save(orders)
-                return o
-    return None
+    return _orders.update_status(order_id, status)
 
 
 def update_tg_msg_id(order_id: str, msg_id: int) -> None:
-    with _lock:
-        orders = _load()
-        for o in orders:
-            if o.get("id") == order_id:
-                o["tg_msg_id"] = msg_id
-                _save(orders)
-                return
+    _orders.update_tg_msg_id(order_id, msg_id)
 
 
 def count(status: str | None = None, phone: str | None = None) -> int:
-    with _lock:
-        orders = _load()
-
-    if status:
-        orders = [o for o in orders if o.get("status") == status]
-    if phone:
-        orders = [o for o in orders if o.get("phone") == phone]
-    return len(orders)
+    return _orders.count(status, phone)
 
 
 def stats_today() -> dict:
     today = datetime.utcnow().date().isoformat()
-    with _lock:
-        orders = _load()
-
-    today_orders = [o for o in orders if str(o.get("created_at", "")).startswith(today)]
+    by_status = _orders.stats_day(today)
     return {
-        "total":     len(today_orders),
-        "done":      sum(1 for o in today_orders if o.get("status") == "done"),
-        "pending":   sum(1 for o in today_orders if o.get("status") == "pending"),
-        "cancelled": sum(1 for o in today_orders if o.get("status") == "cancelled"),
-        "revenue":   sum(
-            int(o.get("total", 0) or 0)
-            for o in today_orders
-            if o.get("status") not in ("cancelled",)
-        ),
+        "total":     sum(n for n, _ in by_status.values()),
+        "done":      by_status.get("done", [0, 0])[0],
+        "pending":   by_status.get("pending", [0, 0])[0],
+        "cancelled": by_status.get("cancelled", [0, 0])[0],
+        "revenue":   sum(total for st, (_, total) in by_status.items() if st not in ("cancelled",)),
     }
 
 
@@ -165,52 +1465,50 @@ def stats_monthly() -> dict:
     year, mon_num = current_month.split("-")
     month_label = f"{MONTHS_UZ.get(mon_num, mon_num)} {year}"
 
-    with _lock:
-        orders = _load()
-
-    month_orders = [o for o in orders if str(o.get("created_at", "")).startswith(current_month)]
-
-    user_map: dict[str, dict] = {}
-    for o in month_orders:
-        phone = o.get("phone", "unknown")
-        if phone not in user_map:
-            user_map[phone] = {
-                "name":      (o.get("customer_name", "") or "").strip() or "—",
-                "phone":     phone,
-                "total":     0,
-                "done":      0,
-                "cancelled": 0,
-                "revenue":   0,
-            }
-
-        u = user_map[phone]
-        u["total"] += 1
-
-        st = o.get("status", "")
-        if st == "done":
-            u["done"] += 1
-            u["revenue"] += int(o.get("total", 0) or 0)
-        elif st == "cancelled":
-            u["cancelled"] += 1
+    users = []
+    for u in _orders.stats_month(current_month):
+        users.append({
+            "name":      u["name"],
+            "phone":     u["phone"],
+            "total":     sum(u["n"].values()),
+            "done":      u["n"].get("done", 0),
+            "cancelled": u["n"].get("cancelled", 0),
+            "revenue":   u["sum"].get("done", 0),
+        })
 
-    users_sorted = sorted(user_map.values(), key=lambda x: x["total"], reverse=True)
+    users_sorted = sorted(users, key=lambda x: x["total"], reverse=True)
 
     return {
         "month_label": month_label,
-        "total":       len(month_orders),
-        "done":        sum(1 for o in month_orders if o.get("status") == "done"),
-        "cancelled":   sum(1 for o in month_orders if o.get("status") == "cancelled"),
-        "revenue":     sum(int(o.get("total", 0) or 0) for o in month_orders if o.get("status") == "done"),
+        "total":       sum(u["total"] for u in users),
+        "done":        sum(u["done"] for u in users),
+        "cancelled":   sum(u["cancelled"] for u in users),
+        "revenue":     sum(u["revenue"] for u in users),
         "users":       users_sorted,
     }
 
 
+def rebuild_stats() -> None:
+    """Agregatlarni zakazlardan qaytadan quradi (qo‘lda tuzatish uchun)."""
+    _orders.rebuild_stats()
+
+
 # ═══════════════════════════════════════════════════════════════
 #  ORDER COUNTER (order_counter.json) — reset bo‘lmasin
 # ═══════════════════════════════════════════════════════════════
 
 _COUNTER_FILE = DATA_DIR / "order_counter.json"
 _counter_lock = threading.Lock()
+_counter_file_lock = _ProcessLock(_COUNTER_FILE)  # blok band qilish workerlar orasida
+
+# ORDER_ID_BLOCK > 1 bo‘lsa raqamlar blok bilan band qilinadi: diskka har N ta zakazda bir marta
+# yoziladi. Restartda blokning ishlatilmagan qismi o‘tkazib yuboriladi (raqamda bo‘shliq).
+# Bir nechta workerda har biri o‘z blokini oladi: fayl flock ostida qayta o‘qiladi, shuning uchun
+# raqamlar takrorlanmaydi (ORDER_ID_BLOCK > 1 da workerlar orasida tartib aralashishi mumkin).
+ORDER_ID_BLOCK = max(1, int(os.getenv("ORDER_ID_BLOCK", "1")))
+
+_counter_next: int | None = None  # keyingi beriladigan raqam (xotirada)
+_counter_reserved = 0             # order_counter.json dagi band qilingan yuqori chegara
 
 
 def _counter_load() -> int:
@@ -224,35 +1522,73 @@ def _counter_load() -> int:
 
 def _max_order_number_from_orders() -> int:
     """
-    orders.json ichidan eng katta raqamli id ni topadi.
+    Zakazlar ichidan eng katta raqamli id ni topadi.
     ID raqam bo‘lsa (masalan '0001', '0123') ishlaydi.
     """
     try:
-        with _lock:
-            orders = _load()
-        mx = 0
-        for o in orders:
-            oid = str(o.get("id", "")).strip()
-            if oid.isdigit():
-                mx = max(mx, int(oid))
-        return mx
+        return _orders.max_order_number()
     except Exception:
         return 0
 
 
+def _counter_reconcile() -> None:
+    """
+    Startupda bir marta: order_counter.json va zakazlardagi max id dan kattasi.
+    Keyin high-water mark faqat xotirada o‘sadi.
+    """
+    global _counter_next, _counter_reserved
+    last = max(_counter_load(), _max_order_number_from_orders())
+    _counter_next = last + 1
+    _counter_reserved = last
+
+
+def _counter_observe(order_id) -> None:
+    """Tashqaridan berilgan raqamli id (import va h.k.) counterdan oshib ketmasin."""
+    global _counter_next
+    oid = str(order_id or "").strip()
+    if oid.isdigit():
+        n = int(oid)
+        with _counter_lock:
+            if _counter_next is None or n < _counter_next:
+                return
+            if n <= _counter_reserved:
+                _counter_next = n + 1
+            else:
+                # blokimizdan tashqarida: fayldagi chegara ham suriladi — boshqa workerlar bermasin
+                _counter_reserve(n + 1, 0)
+                _counter_next = _counter_reserved + 1
+
+
+def _counter_reserve(num: int, block: int) -> int:
+    """
+    _counter_lock ostida: num dan boshlab block ta raqamni band qiladi → haqiqiy boshlanish.
+    Boshqa worker allaqachon oldinga o‘tgan bo‘lsa, uning chegarasidan keyin olinadi.
+    """
+    global _counter_reserved
+    with _counter_file_lock:
+        num = max(num, _counter_load() + 1)
+        reserved = num + block - 1
+        _atomic_write(_COUNTER_FILE, json.dumps({"last": reserved}, ensure_ascii=False), durable=True)
+    _counter_reserved = reserved
+    return num
+
+
 def next_order_number() -> int:
     """
     Deploy/restart bo‘lsa ham 0001ga qaytmasin:
     - order_counter.json
-    - orders.json dagi max id
-    ikkalasidan kattasini olib +1 qiladi.
+    - zakazlardagi max id
+    ikkalasidan kattasi startupda bir marta olinadi, keyin O(1).
+    Raqam qaytarilishidan oldin counter diskka (fsync) yoziladi — crashdan keyin takrorlanmaydi.
     """
+    global _counter_next
     with _counter_lock:
-        last_file = _counter_load()
-        last_db = _max_order_number_from_orders()
-        last = max(last_file, last_db)
-        num = last + 1
-        _atomic_write(_COUNTER_FILE, json.dumps({"last": num}, ensure_ascii=False))
+        if _counter_next is None:
+            _counter_reconcile()
+        num = _counter_next
+        if num > _counter_reserved:
+            num = _counter_reserve(num, ORDER_ID_BLOCK)
+        _counter_next = num + 1
         return num
 
 
@@ -265,33 +1601,53 @@ def order_id_from_number(num: int) -> str:
 # ═══════════════════════════════════════════════════════════════
 
 _TG_FILE = DATA_DIR / "telegram_users.json"
-_tg_lock = threading.Lock()
+_tg_lock = _ProcessLock(_TG_FILE)
+_tg_commit = _GroupCommit("telegram_users", _tg_lock, lambda batch: _write_json_file(_TG_FILE, batch[-1]))
 
 
 def _tg_load() -> list[dict]:
-    if _TG_FILE.exists():
-        try:
-            return json.loads(_TG_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return []
-    return []
+    if _tg_commit.pending:
+        return _tg_commit.pending[-1]
+    return _read_json_cached(_TG_FILE)
 
 
-def _tg_save(users: list[dict]) -> None:
-    _atomic_write(_TG_FILE, json.dumps(users, ensure_ascii=False, indent=2))
+def _tg_save(users: list[dict]) -> _Ticket:
+    return _tg_commit.submit(users)
+
+
+# phone → user va chat_id → user. Yuklangan ro‘yxat almashganda (fayl o‘zgardi — boshqa worker
+# yozdi yoki kesh yangilandi) qayta quriladi, aks holda save_* ularni joyida yangilaydi.
+# Ikkalasida ham birinchi mos yozuv olinadi (avvalgi chiziqli qidiruv kabi).
+_tg_index: tuple[list, dict, dict] | None = None
+
+
+def _tg_chat_map(users: list[dict]) -> dict[str, dict]:
+    by_chat: dict[str, dict] = {}
+    for u in users:
+        by_chat.setdefault(str(u.get("chat_id", "")), u)
+    return by_chat
+
+
+def _tg_indexed() -> tuple[list[dict], dict[str, dict], dict[str, dict]]:
+    """_tg_lock ostida: (users, phone → user, chat_id → user)."""
+    global _tg_index
+    users = _tg_load()
+    if _tg_index is None or _tg_index[0] is not users:
+        by_phone: dict[str, dict] = {}
+        for u in users:
+            by_phone.setdefault(u.get("phone"), u)
+        _tg_index = (users, by_phone, _tg_chat_map(users))
+    return _tg_index
 
 
 def get_telegram_user(phone: str) -> dict | None:
     with _tg_lock:
-        users = _tg_load()
-    return next((u for u in users if u.get("phone") == phone), None)
+        return _tg_indexed()[1].get(phone)
 
 
 def get_telegram_user_by_chat_id(chat_id) -> dict | None:
-    chat_id_str = str(chat_id)
     with _tg_lock:
-        users = _tg_load()
-    return next((u for u in users if str(u.get("chat_id", "")) == chat_id_str), None)
+        return _tg_indexed()[2].get(str(chat_id))
 
 
 def save_telegram_user(
@@ -300,37 +1656,44 @@ def save_telegram_user(
     username: str | None = None,
     full_name: str | None = None,
 ) -> dict:
+    global _tg_index
     with _tg_lock:
-        users = _tg_load()
-        for u in users:
-            if u.get("phone") == phone:
-                u["chat_id"] = str(chat_id)
-                u["username"] = username
-                u["full_name"] = full_name
-                u.setdefault("coins", 0)
-                _tg_save(users)
-                return u
-
-        user = {
-            "phone": phone,
-            "chat_id": str(chat_id),
-            "username": username,
-            "full_name": full_name,
-            "coins": 0,
-        }
-        users.append(user)
-        _tg_save(users)
-        return user
+        users, by_phone, by_chat = _tg_indexed()
+        user = by_phone.get(phone)
+        if user:
+            moved = user.get("chat_id") != str(chat_id)
+            user["chat_id"] = str(chat_id)
+            user["username"] = username
+            user["full_name"] = full_name
+            user.setdefault("coins", 0)
+            if moved:
+                # eski chat_id boshqa yozuvga qaytishi mumkin — chat xaritasi qayta quriladi
+                _tg_index = (users, by_phone, _tg_chat_map(users))
+        else:
+            user = {
+                "phone": phone,
+                "chat_id": str(chat_id),
+                "username": username,
+                "full_name": full_name,
+                "coins": 0,
+            }
+            users.append(user)
+            by_phone[phone] = user
+            by_chat.setdefault(user["chat_id"], user)
+        done = _tg_save(users)
+    done.wait()
+    return user
 
 
 def update_telegram_user_coins(phone: str, coins: int) -> None:
     with _tg_lock:
-        users = _tg_load()
-        for u in users:
-            if u.get("phone") == phone:
-                u["coins"] = coins
-                _tg_save(users)
-                return
+        users, by_phone, _ = _tg_indexed()
+        user = by_phone.get(phone)
+        if not user:
+            return
+        user["coins"] = coins
+        done = _tg_save(users)
+    done.wait()
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -338,32 +1701,106 @@ def update_telegram_user_coins(phone: str, coins: int) -> None:
 # ═══════════════════════════════════════════════════════════════
 
 _OTP_FILE = DATA_DIR / "otp_codes.json"
-_otp_lock = threading.Lock()
+_otp_lock = _ProcessLock(_OTP_FILE)
+_otp_commit = _GroupCommit("otp_codes", _otp_lock, lambda batch: _write_json_file(_OTP_FILE, batch[-1]))
+
+# Kodlar TTL bilan: expires_at + OTP_SWEEP_GRACE o‘tgach fon sweeper o‘chiradi (grace davomida
+# verify hali "muddati o‘tdi" deb javob beradi). Xotirada phone → kod + muddatlar min-heap’i.
+# OTP_PERSIST=1 (default) — otp_codes.json ga ham yoziladi: restart va boshqa workerlar
+# (send bir workerda, verify boshqasida) uchun kerak. 0 — faqat xotira (bitta worker).
+OTP_PERSIST = os.getenv("OTP_PERSIST", "1").strip().lower() not in ("0", "false", "no")
+OTP_SWEEP_GRACE = float(os.getenv("OTP_SWEEP_GRACE", "600"))
+OTP_SWEEP_INTERVAL = float(os.getenv("OTP_SWEEP_INTERVAL", "30"))
+
+_otp_mem: list[dict] = []  # OTP_PERSIST=0 bo‘lsa yagona nusxa
+_otp_index: tuple[list, dict, list] | None = None  # (kodlar ro‘yxati, phone → kod, heap)
+_otp_sweeper: threading.Thread | None = None
 
 
 def _otp_load() -> list[dict]:
-    if _OTP_FILE.exists():
-        try:
-            return json.loads(_OTP_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return []
-    return []
+    if not OTP_PERSIST:
+        return _otp_mem
+    if _otp_commit.pending:
+        return _otp_commit.pending[-1]
+    return _read_json_cached(_OTP_FILE)
+
 
+def _otp_save(codes: list[dict]) -> _Ticket:
+    global _otp_mem
+    if not OTP_PERSIST:
+        _otp_mem = codes
+        ticket = _Ticket()
+        ticket._finish()
+        return ticket
+    return _otp_commit.submit(codes)
 
-def _otp_save(codes: list[dict]) -> None:
-    _atomic_write(_OTP_FILE, json.dumps(codes, ensure_ascii=False, indent=2))
+
+def _otp_deadline(rec: dict) -> float:
+    return float(rec.get("expires_at", 0) or 0) + OTP_SWEEP_GRACE
+
+
+def _otp_indexed() -> tuple[list[dict], dict[str, dict], list]:
+    """
+    _otp_lock ostida: (kodlar, phone → kod, [(o‘chirish vaqti, phone)] heap).
+    Ro‘yxat almashsa (fayl o‘zgardi — boshqa worker yozdi) qayta quriladi.
+    """
+    global _otp_index, _otp_sweeper
+    codes = _otp_load()
+    if _otp_index is None or _otp_index[0] is not codes:
+        by_phone = {c.get("phone"): c for c in codes}
+        heap = [(_otp_deadline(c), ph) for ph, c in by_phone.items()]
+        heapq.heapify(heap)
+        _otp_index = (codes, by_phone, heap)
+    if _otp_sweeper is None:
+        _otp_sweeper = threading.Thread(target=_otp_sweep_loop, name="otp-sweeper", daemon=True)
+        _otp_sweeper.start()
+    return _otp_index
+
+
+def _otp_replace(by_phone: dict, heap: list) -> _Ticket:
+    """_otp_lock ostida: by_phone dan yangi ro‘yxat yasab saqlaydi (indeks shu ro‘yxatga bog‘lanadi)."""
+    global _otp_index
+    codes = list(by_phone.values())
+    _otp_index = (codes, by_phone, heap)
+    return _otp_save(codes)
+
+
+def _otp_sweep() -> int:
+    """Muddati (+grace) o‘tgan kodlarni o‘chiradi → o‘chirilganlar soni."""
+    now = time.time()
+    with _otp_lock:
+        _, by_phone, heap = _otp_indexed()
+        removed = 0
+        while heap and heap[0][0] <= now:
+            deadline, phone = heapq.heappop(heap)
+            rec = by_phone.get(phone)
+            # heap’dagi eski yozuv (kod qayta yuborilgan) — o‘tkazib yuboriladi
+            if rec is not None and _otp_deadline(rec) <= now:
+                del by_phone[phone]
+                removed += 1
+        done = _otp_replace(by_phone, heap) if removed else None
+    if done is not None:
+        done.wait()
+    return removed
+
+
+def _otp_sweep_loop() -> None:
+    while True:
+        time.sleep(OTP_SWEEP_INTERVAL)
+        try:
+            _otp_sweep()
+        except Exception as e:
+            print(f"otp sweeper xato: {e}")
 
 
 def get_otp(phone: str) -> dict | None:
     with _otp_lock:
-        codes = _otp_load()
-    return next((c for c in codes if c.get("phone") == phone), None)
+        return _otp_indexed()[1].get(phone)
 
 
 def save_otp(phone: str, code: str, expires_at: float, mode: str = "login") -> dict:
     with _otp_lock:
-        codes = _otp_load()
-        codes = [c for c in codes if c.get("phone") != phone]
+        _, by_phone, heap = _otp_indexed()
         record = {
             "phone": phone,
             "code": code,
@@ -371,27 +1808,34 @@ def save_otp(phone: str, code: str, expires_at: float, mode: str = "login") -> d
             "attempts": 0,
             "mode": mode,
         }
-        codes.append(record)
-        _otp_save(codes)
-        return record
+        by_phone.pop(phone, None)  # ro‘yxatda oxiriga o‘tadi (avvalgidek)
+        by_phone[phone] = record
+        heapq.heappush(heap, (_otp_deadline(record), phone))
+        done = _otp_replace(by_phone, heap)
+    done.wait()
+    return record
 
 
 def delete_otp(phone: str) -> None:
     with _otp_lock:
-        codes = _otp_load()
-        codes = [c for c in codes if c.get("phone") != phone]
-        _otp_save(codes)
+        _, by_phone, heap = _otp_indexed()
+        if by_phone.pop(phone, None) is None:
+            return  # heap’dagi yozuvi sweeper’da o‘z-o‘zidan tushib ketadi
+        done = _otp_replace(by_phone, heap)
+    done.wait()
 
 
 def increment_otp_attempts(phone: str) -> int:
     with _otp_lock:
-        codes = _otp_load()
-        for c in codes:
-            if c.get("phone") == phone:
-                c["attempts"] = int(c.get("attempts", 0) or 0) + 1
-                _otp_save(codes)
-                return c["attempts"]
-    return 0
+        codes, by_phone, _ = _otp_indexed()
+        rec = by_phone.get(phone)
+        if not rec:
+            return 0
+        rec["attempts"] = int(rec.get("attempts", 0) or 0) + 1
+        attempts = rec["attempts"]
+        done = _otp_save(codes)
+    done.wait()
+    return attempts
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -399,20 +1843,18 @@ def increment_otp_attempts(phone: str) -> int:
 # ═══════════════════════════════════════════════════════════════
 
 _USERS_FILE = DATA_DIR / "registered_users.json"
-_users_lock = threading.Lock()
+_users_lock = _ProcessLock(_USERS_FILE)
+_users_commit = _GroupCommit("registered_users", _users_lock, lambda batch: _write_json_file(_USERS_FILE, batch[-1]))
 
 
 def _users_load() -> list[dict]:
-    if _USERS_FILE.exists():
-        try:
-            return json.loads(_USERS_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return []
-    return []
+    if _users_commit.pending:
+        return _users_commit.pending[-1]
+    return _read_json_cached(_USERS_FILE)
 
 
-def _users_save(users: list[dict]) -> None:
-    _atomic_write(_USERS_FILE, json.dumps(users, ensure_ascii=False, indent=2))
+def _users_save(users: list[dict]) -> _Ticket:
+    return _users_commit.submit(users)
 
 
 def get_registered_user(phone: str) -> dict | None:
@@ -424,95 +1866,349 @@ def get_registered_user(phone: str) -> dict | None:
 def save_registered_user(phone: str, first_name: str, last_name: str) -> dict:
     with _users_lock:
         users = _users_load()
-        for u in users:
-            if u.get("phone") == phone:
-                u["firstName"] = first_name
-                u["lastName"] = last_name
-                _users_save(users)
-                return u
-
-        user = {"phone": phone, "firstName": first_name, "lastName": last_name}
-        users.append(user)
-        _users_save(users)
-        return user
+        user = next((u for u in users if u.get("phone") == phone), None)
+        if user:
+            user["firstName"] = first_name
+            user["lastName"] = last_name
+        else:
+            user = {"phone": phone, "firstName": first_name, "lastName": last_name}
+            users.append(user)
+        done = _users_save(users)
+    done.wait()
+    return user
 
 
 # ═══════════════════════════════════════════════════════════════
-#  COINS (coins.json)
+#  COINS (coins.json + coins_ledger/<phone>.jsonl)
 # ═══════════════════════════════════════════════════════════════
+#
+# coins.json — faqat balanslar: [{"phone", "balance"}], xotirada phone → yozuv (O(1)).
+# Tarix alohida, har telefon uchun append-only ledger:
+#   {"type": "earn"|"spend", "amount", "order_id", "at", "balance"}   (balance — amaldan keyin)
+# Bitta group commit: avval ledger qatorlari (fsync), keyin coins.json.
+# Crash ikkalasi orasida bo‘lsa, startupda ledgerning oxirgi balance’i bo‘yicha tuzatiladi.
+# Eski coins.json dagi inline "history" birinchi yuklashda ledgerga ko‘chiriladi.
 
 _COINS_FILE = DATA_DIR / "coins.json"
-_coins_lock = threading.Lock()
+COINS_LEDGER_DIR = Path(os.getenv("COINS_LEDGER_DIR", str(DATA_DIR / "coins_ledger"))).resolve()
+_LEDGER_CHUNK = 8192
 
 
-def _coins_load() -> list[dict]:
-    if _COINS_FILE.exists():
-        try:
-            return json.loads(_COINS_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return []
-    return []
+def _coins_flush(batch: list[tuple[list[dict], list[tuple[str, dict]]]]) -> None:
+    lines: dict[str, list[str]] = {}
+    for _, entries in batch:
+        for phone, entry in entries:
+            lines.setdefault(phone, []).append(json.dumps(entry, ensure_ascii=False) + "\n")
+    try:
+        if lines:
+            COINS_LEDGER_DIR.mkdir(parents=True, exist_ok=True)
+        for phone, chunk in lines.items():
+            with _ledger_path(phone).open("ab") as f:
+                f.write("".join(chunk).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+    except Exception:
+        _json_cache.pop(_COINS_FILE, None)  # xotiradagi balanslar diskka tushmadi
+        raise
+    _write_json_file(_COINS_FILE, batch[-1][0])
 
 
-def _coins_save(data: list[dict]) -> None:
-    _atomic_write(_COINS_FILE, json.dumps(data, ensure_ascii=False, indent=2))
+_coins_lock = _ProcessLock(_COINS_FILE)
+_coins_commit = _GroupCommit("coins", _coins_lock, _coins_flush)
+_coins_index: tuple[list, dict] | None = None  # (balanslar ro‘yxati, phone → yozuv)
+
+
+def _ledger_path(phone: str) -> Path:
+    return COINS_LEDGER_DIR / (re.sub(r"[^0-9A-Za-z+_-]", "_", phone or "unknown") + ".jsonl")
+
+
+def _coins_load() -> list[dict]:
+    if _coins_commit.pending:
+        return _coins_commit.pending[-1][0]
+    return _read_json_cached(_COINS_FILE)
+
+
+def _coins_save(data: list[dict], entries: list[tuple[str, dict]]) -> _Ticket:
+    return _coins_commit.submit((data, entries))
+
+
+def _coins_migrate(data: list[dict]) -> list[dict]:
+    """_coins_lock ostida: inline history → ledger fayllar, coins.json dan history olib tashlanadi."""
+    COINS_LEDGER_DIR.mkdir(parents=True, exist_ok=True)
+    out = []
+    for rec in data:
+        history = rec.get("history") or []
+        balance = int(rec.get("balance", 0) or 0)
+        if history:
+            running = balance - sum(
+                int(h.get("amount", 0) or 0) * (-1 if h.get("type") == "spend" else 1) for h in history
+            )
+            lines = []
+            for h in history:
+                running += int(h.get("amount", 0) or 0) * (-1 if h.get("type") == "spend" else 1)
+                lines.append(json.dumps({**h, "balance": running}, ensure_ascii=False) + "\n")
+            # butun fayl qayta yoziladi — ko‘chirish yarim qolsa, takrorlash xavfsiz
+            _atomic_write(_ledger_path(rec.get("phone")), "".join(lines), durable=True)
+        out.append({k: v for k, v in rec.items() if k != "history"})
+    _write_json_file(_COINS_FILE, out)
+    print(f"🪙 coins.json: {sum(1 for r in data if r.get('history'))} ta tarix ledgerga ko‘chirildi")
+    return out
+
+
+def _coins_indexed() -> tuple[list[dict], dict[str, dict]]:
+    """_coins_lock ostida: (balanslar, phone → yozuv). Ro‘yxat almashsa qayta quriladi."""
+    global _coins_index
+    data = _coins_load()
+    if _coins_index is None or _coins_index[0] is not data:
+        if any("history" in r for r in data):
+            data = _coins_migrate(data)
+        by_phone: dict[str, dict] = {}
+        for r in data:
+            by_phone.setdefault(r.get("phone"), r)
+        _coins_index = (data, by_phone)
+    return _coins_index
+
+
+def _ledger_has(phone: str, order_id: str, scan: int = 500) -> bool:
+    """Telefon ledgerining oxirgi scan ta yozuvida shu zakaz uchun spend bormi."""
+    path = _ledger_path(phone)
+    if not path.exists():
+        return False
+    entries, _ = _ledger_page(path, path.stat().st_size, scan)
+    return any(e.get("type") == "spend" and e.get("order_id") == order_id for e in entries)
+
+
+def _ledger_last(path: Path) -> dict | None:
+    """Ledgerning oxirgi to‘liq yozuvi (faylni boshidan o‘qimasdan)."""
+    entries, _ = _ledger_page(path, path.stat().st_size, 1)
+    return entries[0] if entries else None
+
+
+def _coins_reconcile() -> None:
+    """
+    Startupda: ledger coins.json dan oldinda qolgan bo‘lsa (crash), balans ledgerdan olinadi.
+    Fayl nomidan telefon tiklanmaydi (_ledger_path belgilarni almashtiradi): ledger yozuv
+    orqali topiladi, yangi telefon uchun esa yozuvdagi "phone" maydonidan olinadi.
+    """
+    if not COINS_LEDGER_DIR.exists():
+        return
+    with _coins_lock:
+        data, by_phone = _coins_indexed()
+        by_path = {_ledger_path(r.get("phone")): r for r in data}
+        fixed = []
+        for path in COINS_LEDGER_DIR.glob("*.jsonl"):
+            last = _ledger_last(path)
+            if not last or "balance" not in last:
+                continue
+            rec = by_path.get(path)
+            if rec is None:
+                phone = last.get("phone")
+                if not phone:
+                    continue  # eski formatdagi yozuv — egasini aniqlab bo‘lmaydi
+                rec = {"phone": phone, "balance": 0}
+                data.append(rec)
+                by_phone[phone] = rec
+                by_path[path] = rec
+            if int(rec.get("balance", 0) or 0) != int(last["balance"]):
+                rec["balance"] = int(last["balance"])
+                fixed.append(rec["phone"])
+        done = _coins_save(data, []) if fixed else None
+    if done is not None:
+        done.wait()
+        print(f"🪙 coins.json ledger bo‘yicha tuzatildi: {len(fixed)} ta")
+
+
+def _coins_apply(phone: str, amount: int, kind: str, order_id: str) -> tuple[int, _Ticket]:
+    """
+    _coins_lock ostida: balansni o‘zgartiradi va ledger yozuvini commit’ga beradi →
+    (yangi balans, ticket). spend’da balans yetmasa ValueError.
+    """
+    data, by_phone = _coins_indexed()
+    rec = by_phone.get(phone)
+    balance = int(rec.get("balance", 0) or 0) if rec else 0
+    if kind == "spend":
+        if not rec or balance < int(amount):
+            raise ValueError("Yetarli coin yo'q")
+        balance -= int(amount)
+    else:
+        balance += int(amount)
+    if rec is None:
+        rec = {"phone": phone, "balance": 0}
+        data.append(rec)
+        by_phone[phone] = rec
+    rec["balance"] = balance
+    entry = {
+        "phone": phone,
+        "type": kind,
+        "amount": int(amount),
+        "order_id": order_id,
+        "at": datetime.utcnow().isoformat(),
+        "balance": balance,
+    }
+    return balance, _coins_save(data, [(phone, entry)])
 
 
 def get_coins(phone: str) -> int:
     with _coins_lock:
-        data = _coins_load()
-    rec = next((r for r in data if r.get("phone") == phone), None)
+        rec = _coins_indexed()[1].get(phone)
     return int(rec.get("balance", 0) or 0) if rec else 0
 
 
 def add_coins(phone: str, amount: int, order_id: str) -> int:
-    now_str = datetime.utcnow().isoformat()
     with _coins_lock:
-        data = _coins_load()
-        rec = next((r for r in data if r.get("phone") == phone), None)
-        if rec:
-            rec["balance"] = int(rec.get("balance", 0) or 0) + int(amount)
-            rec.setdefault("history", []).append({
-                "type": "earn",
-                "amount": int(amount),
-                "order_id": order_id,
-                "at": now_str,
-            })
-        else:
-            rec = {
-                "phone": phone,
-                "balance": int(amount),
-                "history": [{
-                    "type": "earn",
-                    "amount": int(amount),
-                    "order_id": order_id,
-                    "at": now_str,
-                }],
-            }
-            data.append(rec)
-
-        _coins_save(data)
-        return int(rec["balance"])
+        balance, done = _coins_apply(phone, amount, "earn", order_id)
+    done.wait()
+    return balance
 
 
 def spend_coins(phone: str, amount: int, order_id: str) -> int:
-    now_str = datetime.utcnow().isoformat()
     with _coins_lock:
-        data = _coins_load()
-        rec = next((r for r in data if r.get("phone") == phone), None)
-        if not rec or int(rec.get("balance", 0) or 0) < int(amount):
-            raise ValueError("Yetarli coin yo'q")
+        balance, done = _coins_apply(phone, amount, "spend", order_id)
+    done.wait()
+    return balance
 
-        rec["balance"] = int(rec.get("balance", 0) or 0) - int(amount)
-        rec.setdefault("history", []).append({
-            "type": "spend",
-            "amount": int(amount),
-            "order_id": order_id,
-            "at": now_str,
-        })
 
-        _coins_save(data)
-        return int(rec["balance"])
+def _ledger_page(path: Path, end: int, limit: int) -> tuple[list[dict], int]:
+    """
+    [0, end) oralig‘idan oxirgi limit ta qatorni teskari o‘qiydi (faylni boshidan emas)
+    → (yozuvlar yangidan eskiga, qolgan qismning oxiri). end qator chegarasida bo‘lmasa
+    (yozilayotgan qator) — oxirgi "\n" gacha qisqartiriladi.
+    """
+    entries: list[dict] = []
+    with path.open("rb") as f:
+        pos, buf = end, b""
+
+        def more() -> bytes:
+            nonlocal pos
+            step = min(_LEDGER_CHUNK, pos)
+            pos -= step
+            f.seek(pos)
+            return f.read(step)
+
+        while pos > 0:
+            buf = more() + buf
+            cut = buf.rfind(b"\n")
+            if cut >= 0:
+                buf = buf[:cut + 1]
+                break
+        else:
+            buf = b""
+        # buf = fayl[pos : pos + len(buf)] va "\n" bilan tugaydi
+        while len(entries) < limit and (buf or pos > 0):
+            nl = buf.rfind(b"\n", 0, len(buf) - 1) if buf else -1
+            if nl < 0 and pos > 0:
+                buf = more() + buf
+                continue
+            line, buf = buf[nl + 1:], buf[:nl + 1]
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries, pos + len(buf)
+
+
+def coins_history(phone: str, cursor: str | None = None, limit: int = 20) -> tuple[list[dict], str | None]:
+    """
+    Coin tarixi yangidan eskiga, sahifalab. cursor — oldingi javobdagi next_cursor
+    (ledger faylidagi bayt joyi; fayl append-only, shuning uchun joylar o‘zgarmaydi).
+    Noto‘g‘ri cursor → ValueError("BAD_CURSOR").
+    """
+    path = _ledger_path(phone)
+    size = path.stat().st_size if path.exists() else 0
+    if cursor is None:
+        end = size
+    else:
+        try:
+            end = int(cursor)
+        except ValueError:
+            raise ValueError("BAD_CURSOR")
+        if not 0 < end <= size:
+            raise ValueError("BAD_CURSOR")
+    if end == 0:
+        return [], None
+    entries, rest = _ledger_page(path, end, limit)
+    return entries, (str(rest) if rest > 0 and len(entries) == limit else None)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  MENU VERSION (menu_version.json + menu_changes.jsonl)
+# ═══════════════════════════════════════════════════════════════
+#
+# Menyu fayllaridan biri yozilgan har safar +1 (avval fayl, keyin o‘zgarishlar logi, keyin
+# versiya — versiyani ko‘rgan o‘quvchi albatta yangi faylni o‘qiydi). Javob keshlari (main.py)
+# shu raqam bilan kalitlanadi; fayl umumiy, shuning uchun boshqa worker qilgan o‘zgarish ham
+# keshni eskirtiradi.
+# menu_changes.jsonl: {"v", "kind": "category"|"food", "id", "op": "upsert"|"delete"} —
+# GET /api/menu?since=v delta’si uchun. Oxirgi MENU_CHANGES_KEEP qator saqlanadi;
+# undan eski since → to‘liq snapshot.
+
+MENU_VERSION_FILE = DATA_DIR / "menu_version.json"
+MENU_CHANGES_FILE = DATA_DIR / "menu_changes.jsonl"
+MENU_CHANGES_KEEP = int(os.getenv("MENU_CHANGES_KEEP", "2000"))
+_menu_version_lock = _ProcessLock(MENU_VERSION_FILE)
+
+
+def menu_version() -> int:
+    return int(_read_json_cached(MENU_VERSION_FILE, dict).get("version", 0) or 0)
+
+
+def _menu_bump(kind: str, item_id: int, op: str) -> int:
+    with _menu_version_lock:
+        version = menu_version() + 1
+        line = json.dumps({"v": version, "kind": kind, "id": item_id, "op": op}) + "\n"
+        with MENU_CHANGES_FILE.open("a", encoding="utf-8") as f:
+            f.write(line)
+            size = f.tell()
+        if size > MENU_CHANGES_KEEP * 2 * len(line):
+            kept = MENU_CHANGES_FILE.read_text(encoding="utf-8").splitlines(keepends=True)[-MENU_CHANGES_KEEP:]
+            _atomic_write(MENU_CHANGES_FILE, "".join(kept))
+        _write_json_file(MENU_VERSION_FILE, {"version": version}, durable=False)
+    return version
+
+
+def _menu_changes_load() -> list[dict]:
+    """menu_changes.jsonl — o‘zgarmagan bo‘lsa keshdan (_read_json_cached kabi)."""
+    key = _file_key(MENU_CHANGES_FILE)
+    if key is None:
+        return []
+    hit = _json_cache.get(MENU_CHANGES_FILE)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    changes = _read_log(MENU_CHANGES_FILE)
+    _json_cache[MENU_CHANGES_FILE] = (_cache_key(key), changes)
+    return changes
+
+
+def _since_covered(since: int, version: int, changes: list[dict]) -> bool:
+    return since == version or (since < version and bool(changes) and changes[0].get("v", 0) <= since + 1)
+
+
+def menu_since_in_log(since: int) -> bool:
+    """since uchun delta berish mumkinmi (aks holda to‘liq snapshot) — diffni hisoblamaydi."""
+    with _menu_version_lock:
+        return _since_covered(since, menu_version(), _menu_changes_load())
+
+
+def menu_changes_since(since: int) -> tuple[int, dict[tuple[str, int], str] | None]:
+    """
+    (joriy versiya, {(kind, id): oxirgi op}) — since dan keyingi o‘zgarishlar.
+    Log since gacha yetib bormasa (qisqartirilgan / eski versiya) → None: to‘liq snapshot kerak.
+    """
+    with _menu_version_lock:
+        version = menu_version()
+        changes = _menu_changes_load()
+    if since == version:
+        return version, {}
+    if not _since_covered(since, version, changes):
+        return version, None
+    out: dict[tuple[str, int], str] = {}
+    for ch in changes:
+        if since < ch.get("v", 0) <= version:
+            out[(ch.get("kind"), ch.get("id"))] = ch.get("op")
+    return version, out
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -520,20 +2216,16 @@ def spend_coins(phone: str, amount: int, order_id: str) -> int:
 # ═══════════════════════════════════════════════════════════════
 
 MENU_CATEGORIES_FILE = DATA_DIR / "menu_categories.json"
-_menu_cat_lock = threading.Lock()
+_menu_cat_lock = _ProcessLock(MENU_CATEGORIES_FILE)
 
 
 def _menu_categories_load() -> list[dict]:
-    if MENU_CATEGORIES_FILE.exists():
-        try:
-            return json.loads(MENU_CATEGORIES_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            return []
-    return []
+    return _read_json_cached(MENU_CATEGORIES_FILE)
 
 
-def _menu_categories_save(cats: list[dict]) -> None:
-    _atomic_write(MENU_CATEGORIES_FILE, json.dumps(cats, ensure_ascii=False, indent=2))
+def _menu_categories_save(cats: list[dict], cat_id: int, op: str = "upsert") -> None:
+    _write_json_file(MENU_CATEGORIES_FILE, cats, durable=False)
+    _menu_bump("category", cat_id, op)
 
 
 def menu_next_category_id() -> int:
@@ -544,12 +2236,20 @@ def menu_next_category_id() -> int:
 
 
 def menu_get_categories(active_only: bool = False) -> list[dict]:
+    """food_count — kategoriyadagi taomlar soni (active_only bo‘lsa faqat faollari)."""
     with _menu_cat_lock:
         cats = _menu_categories_load()
     if active_only:
         cats = [c for c in cats if c.get("is_active", True)]
-    cats.sort(key=lambda c: c.get("sort_order", 0))
-    return cats
+    with _menu_food_lock:
+        index = _menu_foods_indexed()
+        cats = [{**c, "food_count": index.category_count(c.get("key", ""), active_only)} for c in cats]
+    return sorted(cats, key=lambda c: c.get("sort_order", 0))
+
+
+def menu_category_keys() -> set[str]:
+    with _menu_cat_lock:
+        return {c.get("key") for c in _menu_categories_load()}
 
 
 def menu_create_category(cat: dict) -> dict:
@@ -557,7 +2257,7 @@ def menu_create_category(cat: dict) -> dict:
         cats = _menu_categories_load()
         cat["id"] = menu_next_category_id()
         cats.append(cat)
-        _menu_categories_save(cats)
+        _menu_categories_save(cats, cat["id"])
     return cat
 
 
@@ -566,10 +2266,12 @@ def menu_update_category(cat_id: int, patch: dict) -> dict | None:
         cats = _menu_categories_load()
         for c in cats:
             if int(c.get("id", 0)) == cat_id:
+                if "image_url" in patch and patch["image_url"] != c.get("image_url"):
+                    c.pop("image_variants", None)  # eski rasmning variantlari
                 for k, v in patch.items():
                     if k != "id":
                         c[k] = v
-                _menu_categories_save(cats)
+                _menu_categories_save(cats, cat_id)
                 return c
     return None
 
@@ -582,12 +2284,12 @@ def menu_delete_category(cat_id: int) -> bool:
         if not target:
             return False
         # Check if any food uses this category
-        foods = _menu_foods_load()
-        key = target.get("key", "")
-        if any(f.get("category") == key for f in foods):
+        with _menu_food_lock:
+            has_foods = _menu_foods_indexed().category_count(target.get("key", "")) > 0
+        if has_foods:
             raise ValueError("CATEGORY_HAS_FOODS")
         cats = [c for c in cats if int(c.get("id", 0)) != cat_id]
-        _menu_categories_save(cats)
+        _menu_categories_save(cats, cat_id, "delete")
     return True
 
 
@@ -596,20 +2298,181 @@ def menu_delete_category(cat_id: int) -> bool:
 # ═══════════════════════════════════════════════════════════════
 
 MENU_FOODS_FILE = DATA_DIR / "menu_foods.json"
-_menu_food_lock = threading.Lock()
+_menu_food_lock = _ProcessLock(MENU_FOODS_FILE)
 
 
 def _menu_foods_load() -> list[dict]:
-    if MENU_FOODS_FILE.exists():
-        try:
-            return json.loads(MENU_FOODS_FILE.read_text(encoding="utf-8"))
-        except Exception:
+    return _read_json_cached(MENU_FOODS_FILE)
+
+
+def _menu_foods_save(foods: list[dict], food_id: int, op: str = "upsert") -> None:
+    _write_json_file(MENU_FOODS_FILE, foods, durable=False)
+    _menu_bump("food", food_id, op)
+
+
+# ── qidiruv indeksi ─────────────────────────────────────────────
+#
+# name / fullName / description so‘zlari (kichik harf, apostroflarsiz) → taomlar.
+# So‘rovning har so‘zi mos kelishi kerak; bal: maydon og‘irligi × moslik
+# (to‘liq so‘z 3, prefiks 2, trigram o‘xshashligi — xatoli yozuv uchun).
+
+_APOSTROPHES = str.maketrans("", "", "'‘’ʻʼ`")
+_SEARCH_FIELDS = (("name", 3.0), ("fullName", 2.0), ("description", 1.0))
+_TRIGRAM_MIN_SIM = 0.3
+
+
+def _search_tokens(text) -> list[str]:
+    return re.findall(r"\w+", str(text or "").lower().translate(_APOSTROPHES))
+
+
+def _trigrams(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _FoodIndex:
+    """
+    menu_foods.json ustidagi indekslar (hammasi _menu_food_lock ostida):
+      by_id    — id → taom
+      seq      — id → fayldagi tartib (natijalar fayl tartibida qaytadi)
+      by_category / active_count — kategoriya key → id’lar / faol taomlar soni
+      postings — so‘z → {id: eng katta maydon og‘irligi}
+      tokens   — tartiblangan so‘zlar (prefiks qidiruv, bisect)
+      grams    — trigram → so‘zlar
+      gram_n   — so‘z → trigramlari soni (Jaccard maxraji uchun)
+    source — indeks qurilgan ro‘yxat: fayl o‘zgarsa (boshqa worker) yangi ro‘yxat keladi va
+    indeks qaytadan quriladi; o‘z yozuvlarimiz add/remove bilan joyida yangilanadi.
+    """
+
+    def __init__(self, foods: list[dict]):
+        self.source = foods
+        self.by_id: dict[int, dict] = {}
+        self.seq: dict[int, int] = {}
+        self.by_category: dict[str, set[int]] = {}
+        self.active_count: dict[str, int] = {}
+        self.postings: dict[str, dict[int, float]] = {}
+        self.tokens: list[str] = []
+        self.grams: dict[str, set[str]] = {}
+        self.gram_n: dict[str, int] = {}
+        self._terms: dict[int, dict[str, float]] = {}
+        self._next_seq = 0
+        for f in foods:
+            self.add(f)
+
+    def add(self, food: dict) -> None:
+        fid = int(food.get("id", 0))
+        self.by_id[fid] = food
+        if fid not in self.seq:
+            self.seq[fid] = self._next_seq
+            self._next_seq += 1
+        cat = food.get("category")
+        self.by_category.setdefault(cat, set()).add(fid)
+        if food.get("is_active", True):
+            self.active_count[cat] = self.active_count.get(cat, 0) + 1
+        terms: dict[str, float] = {}
+        for field, weight in _SEARCH_FIELDS:
+            for tok in _search_tokens(food.get(field)):
+                terms[tok] = max(terms.get(tok, 0.0), weight)
+        self._terms[fid] = terms
+        for tok, weight in terms.items():
+            posting = self.postings.get(tok)
+            if posting is None:
+                posting = self.postings[tok] = {}
+                bisect.insort(self.tokens, tok)
+                grams = _trigrams(tok)
+                self.gram_n[tok] = len(grams)
+                for g in grams:
+                    self.grams.setdefault(g, set()).add(tok)
+            posting[fid] = weight
+
+    def remove(self, fid: int, keep_seq: bool = False) -> None:
+        food = self.by_id.pop(fid, None)
+        if food is not None:
+            cat = food.get("category")
+            ids = self.by_category.get(cat)
+            if ids is not None:
+                ids.discard(fid)
+                if not ids:
+                    del self.by_category[cat]
+            if food.get("is_active", True):
+                self.active_count[cat] -= 1
+                if not self.active_count[cat]:
+                    del self.active_count[cat]
+        if not keep_seq:
+            self.seq.pop(fid, None)
+        for tok in self._terms.pop(fid, {}):
+            posting = self.postings.get(tok)
+            if posting is None:
+                continue
+            posting.pop(fid, None)
+            if not posting:
+                del self.postings[tok]
+                _remove_key(self.tokens, tok)
+                del self.gram_n[tok]
+                for g in _trigrams(tok):
+                    bucket = self.grams.get(g)
+                    if bucket is not None:
+                        bucket.discard(tok)
+                        if not bucket:
+                            del self.grams[g]
+
+    def _term_scores(self, term: str) -> dict[int, float]:
+        scores: dict[int, float] = {}
+
+        def hit(tok: str, quality: float) -> None:
+            for fid, weight in self.postings[tok].items():
+                score = weight * quality
+                if score > scores.get(fid, 0.0):
+                    scores[fid] = score
+
+        i = bisect.bisect_left(self.tokens, term)
+        while i < len(self.tokens) and self.tokens[i].startswith(term):
+            hit(self.tokens[i], 3.0 if self.tokens[i] == term else 2.0)
+            i += 1
+        if len(term) >= 3:
+            grams = _trigrams(term)
+            shared: dict[str, int] = {}
+            for g in grams:
+                for tok in self.grams.get(g, ()):
+                    shared[tok] = shared.get(tok, 0) + 1
+            for tok, n in shared.items():
+                sim = n / (len(grams) + self.gram_n[tok] - n)  # Jaccard: |A ∩ B| / |A ∪ B|
+                if sim >= _TRIGRAM_MIN_SIM and not tok.startswith(term):
+                    hit(tok, sim)
+        return scores
+
+    def in_category(self, key: str) -> list[dict]:
+        ids = self.by_category.get(key, ())
+        return [self.by_id[fid] for fid in sorted(ids, key=self.seq.__getitem__)]
+
+    def category_count(self, key: str, active_only: bool = False) -> int:
+        if active_only:
+            return self.active_count.get(key, 0)
+        return len(self.by_category.get(key, ()))
+
+    def search(self, query: str) -> list[int]:
+        """Mos taomlar id’lari, eng yuqori baldan (teng bo‘lsa fayl tartibida)."""
+        total: dict[int, float] | None = None
+        for term in dict.fromkeys(_search_tokens(query)):
+            scores = self._term_scores(term)
+            total = scores if total is None else {fid: sc + scores[fid] for fid, sc in total.items() if fid in scores}
+            if not total:
+                return []
+        if total is None:
             return []
-    return []
+        return sorted(total, key=lambda fid: (-total[fid], self.seq.get(fid, 0)))
+
+
+_food_index: _FoodIndex | None = None
 
 
-def _menu_foods_save(foods: list[dict]) -> None:
-    _atomic_write(MENU_FOODS_FILE, json.dumps(foods, ensure_ascii=False, indent=2))
+def _menu_foods_indexed() -> _FoodIndex:
+    """_menu_food_lock ostida: joriy ro‘yxatga bog‘langan indeks."""
+    global _food_index
+    foods = _menu_foods_load()
+    if _food_index is None or _food_index.source is not foods:
+        _food_index = _FoodIndex(foods)
+    return _food_index
 
 
 def menu_next_food_id() -> int:
@@ -624,47 +2487,195 @@ def menu_get_foods(
     search: str | None = None,
     active_only: bool = False,
 ) -> list[dict]:
+    """search bo‘lsa natijalar baldan kamayish tartibida (name > fullName > description)."""
     with _menu_food_lock:
-        foods = _menu_foods_load()
+        if search and search.strip():
+            index = _menu_foods_indexed()
+            foods = [index.by_id[fid] for fid in index.search(search)]
+            if category:
+                foods = [f for f in foods if f.get("category") == category]
+        elif category:
+            foods = _menu_foods_indexed().in_category(category)
+        else:
+            foods = _menu_foods_load()
     if active_only:
         foods = [f for f in foods if f.get("is_active", True)]
-    if category:
-        foods = [f for f in foods if f.get("category") == category]
-    if search:
-        q = search.lower()
-        foods = [f for f in foods if q in (f.get("name", "") or "").lower()]
-    return foods
+    return list(foods)
 
 
 def menu_create_food(food: dict) -> dict:
     with _menu_food_lock:
-        foods = _menu_foods_load()
+        index = _menu_foods_indexed()
+        foods = index.source
         food["id"] = menu_next_food_id()
         food["created_at"] = datetime.utcnow().isoformat()
         foods.append(food)
-        _menu_foods_save(foods)
+        index.add(food)
+        _menu_foods_save(foods, food["id"])
     return food
 
 
 def menu_update_food(food_id: int, patch: dict) -> dict | None:
     with _menu_food_lock:
-        foods = _menu_foods_load()
-        for f in foods:
-            if int(f.get("id", 0)) == food_id:
-                for k, v in patch.items():
-                    if k != "id":
-                        f[k] = v
-                _menu_foods_save(foods)
-                return f
-    return None
+        index = _menu_foods_indexed()
+        f = index.by_id.get(food_id)
+        if f is None:
+            return None
+        index.remove(food_id, keep_seq=True)
+        if "image" in patch and patch["image"] != f.get("image"):
+            f.pop("image_variants", None)  # eski rasmning variantlari
+        for k, v in patch.items():
+            if k != "id":
+                f[k] = v
+        index.add(f)
+        _menu_foods_save(index.source, food_id)
+        return f
 
 
 def menu_delete_food(food_id: int) -> bool:
     with _menu_food_lock:
-        foods = _menu_foods_load()
-        orig_len = len(foods)
-        foods = [f for f in foods if int(f.get("id", 0)) != food_id]
-        if len(foods) == orig_len:
+        index = _menu_foods_indexed()
+        if food_id not in index.by_id:
             return False
-        _menu_foods_save(foods)
+        foods = [f for f in index.source if int(f.get("id", 0)) != food_id]
+        index.remove(food_id)
+        index.source = foods
+        _menu_foods_save(foods, food_id, "delete")
     return True
+
+
+def menu_attach_image_variants(url: str, variants: dict) -> int:
+    """
+    Fonda yasalgan rasm variantlarini shu rasmni ishlatayotgan barcha taom (image)
+    va kategoriyalarga (image_url) yozadi. Nechta yozuv o‘zgargani qaytadi.
+    """
+    changed = 0
+    with _menu_food_lock:
+        foods = _menu_foods_load()
+        ids = [f["id"] for f in foods if f.get("image") == url and f.get("image_variants") != variants]
+        for f in foods:
+            if f.get("id") in ids:
+                f["image_variants"] = variants
+        if ids:
+            _write_json_file(MENU_FOODS_FILE, foods, durable=False)
+            for food_id in ids:
+                _menu_bump("food", food_id, "upsert")
+        changed += len(ids)
+    with _menu_cat_lock:
+        cats = _menu_categories_load()
+        ids = [c["id"] for c in cats if c.get("image_url") == url and c.get("image_variants") != variants]
+        for c in cats:
+            if c.get("id") in ids:
+                c["image_variants"] = variants
+        if ids:
+            _write_json_file(MENU_CATEGORIES_FILE, cats, durable=False)
+            for cat_id in ids:
+                _menu_bump("category", cat_id, "upsert")
+        changed += len(ids)
+    return changed
+
+
+# ═══════════════════════════════════════════════════════════════
+#  MENU SNAPSHOT (GET /api/menu)
+# ═══════════════════════════════════════════════════════════════
+
+def _menu_visible(item: dict | None, active_only: bool) -> bool:
+    return item is not None and (not active_only or item.get("is_active", True))
+
+
+def menu_snapshot(active_only: bool = True, since: int | None = None) -> dict:
+    """
+    Kategoriyalar ichida taomlari bilan + versiya. since berilsa va log yetarli bo‘lsa —
+    faqat o‘zgarganlar: upserted (joriy holat) va deleted (id’lar; active_only da
+    nofaol bo‘lib qolganlar ham). Kategoriya upsert’i o‘z taomlari bilan keladi.
+    """
+    version, changed = menu_changes_since(since) if since is not None else (menu_version(), None)
+    cats = menu_get_categories(active_only=active_only)
+    with _menu_food_lock:
+        index = _menu_foods_indexed()
+        visible_cats = {c.get("key") for c in cats}
+
+        def with_foods(c: dict) -> dict:
+            foods = [f for f in index.in_category(c.get("key", "")) if _menu_visible(f, active_only)]
+            return {**c, "foods": foods}
+
+        if changed is None:
+            return {"version": version, "full": True, "categories": [with_foods(c) for c in cats]}
+
+        cats_by_id = {int(c.get("id", 0)): c for c in cats}
+        delta = {
+            "categories": {"upserted": [], "deleted": []},
+            "foods":      {"upserted": [], "deleted": []},
+        }
+        for kind, item_id in sorted(changed):
+            if kind == "category":
+                c = cats_by_id.get(item_id)
+                if c is None:
+                    delta["categories"]["deleted"].append(item_id)
+                else:
+                    delta["categories"]["upserted"].append(with_foods(c))
+            elif kind == "food":
+                f = index.by_id.get(item_id)
+                if _menu_visible(f, active_only) and f.get("category") in visible_cats:
+                    delta["foods"]["upserted"].append(f)
+                else:
+                    delta["foods"]["deleted"].append(item_id)
+    return {"version": version, "full": False, "since": since, **delta}
+
+
+# ═══════════════════════════════════════════════════════════════
+#  ASYNC FASAD (db.aio)
+# ═══════════════════════════════════════════════════════════════
+#
+# Yuqoridagi funksiyalar sinxron: fayl lock’i, fsync, group commit kutish.
+# async endpoint/bot handler ularni to‘g‘ridan-to‘g‘ri chaqirsa, butun event loop
+# (bot polling ham) disk yozuvini kutib qoladi. `await db.aio.<funksiya>(...)` —
+# xuddi shu funksiya, lekin alohida I/O thread pool’ida.
+
+IO_THREADS = max(1, int(os.getenv("DB_IO_THREADS", "8")))
+_io_executor: ThreadPoolExecutor | None = None
+_io_executor_lock = threading.Lock()
+
+
+def _get_io_executor() -> ThreadPoolExecutor:
+    """Birinchi chaqiruvda yaratiladi; shutdown() dan keyin ham qaytadan."""
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="db-io")
+        return _io_executor
+
+
+class _AsyncFacade:
+    """db.aio.create(order) → await qilinadigan db.create(order)."""
+
+    def __getattr__(self, name: str):
+        fn = globals().get(name)
+        if name.startswith("_") or not callable(fn) or getattr(fn, "__module__", None) != __name__:
+            raise AttributeError(f"database.{name} yo‘q")
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_get_io_executor(), functools.partial(fn, *args, **kwargs))
+
+        call.__name__ = name
+        call.__doc__ = fn.__doc__
+        setattr(self, name, call)  # keyingi safar __getattr__ ga tushmaydi
+        return call
+
+
+aio = _AsyncFacade()
+
+
+# ═══════════════════════════════════════════════════════════════
+#  CLI
+# ═══════════════════════════════════════════════════════════════
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["import-orders"]:
+        src = Path(sys.argv[2]) if len(sys.argv) > 2 else DB_FILE
+        n = import_orders_from_json(src)
+        print(f"📥 {src} → {SQLITE_FILE}: {n} ta zakaz import qilindi")
+    else:
+        print("Foydalanish: python database.py import-orders [orders.json]")
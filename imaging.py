@@ -0,0 +1,64 @@
+"""
+imaging.py — menyu rasmlaridan kichraytirilgan variantlar (thumb / card / full) + WebP
+
+ProcessPool ichida ishlaydi, shuning uchun loyiha modullarini (database, fastapi) import qilmaydi.
+Pillow o‘rnatilmagan bo‘lsa AVAILABLE=False — rasmlar asl holicha beriladi.
+"""
+
+import os
+import uuid
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow ixtiyoriy
+    Image = ImageOps = None
+
+AVAILABLE = Image is not None
+
+# nom → eng katta tomoni (px)
+VARIANTS = (("thumb", 160), ("card", 480), ("full", 1200))
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def _save(img, dest: Path, fmt: str, **opts) -> None:
+    """Vaqtinchalik faylga yozib replace — parallel workerlar bir xil variantni yozsa ham buzilmaydi."""
+    tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        img.save(tmp, fmt, **opts)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def make_variants(src: str) -> dict:
+    """
+    src yonida <stem>_<variant>.jpg|.png va <stem>_<variant>.webp yaratadi (bor bo‘lsa qayta qilmaydi).
+    Shaffof rasm → PNG, qolgani → JPEG. Kattalashtirilmaydi.
+    Qaytaradi: {variant: {"file", "webp", "width", "height"}} — fayl nomlari src papkasiga nisbatan.
+    """
+    path = Path(src)
+    with Image.open(path) as im:
+        im.seek(0)
+        im = ImageOps.exif_transpose(im)
+        alpha = im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info)
+        im = im.convert("RGBA" if alpha else "RGB")
+
+        ext, fmt, opts = (".png", "PNG", {"optimize": True}) if alpha else \
+            (".jpg", "JPEG", {"quality": JPEG_QUALITY, "optimize": True, "progressive": True})
+
+        out = {}
+        for name, size in VARIANTS:
+            v = im.copy()
+            v.thumbnail((size, size), Image.LANCZOS)
+            plain = path.with_name(f"{path.stem}_{name}{ext}")
+            webp = path.with_name(f"{path.stem}_{name}.webp")
+            if not plain.exists():
+                _save(v, plain, fmt, **opts)
+            if not webp.exists():
+                _save(v, webp, "WEBP", quality=WEBP_QUALITY, method=4)
+            out[name] = {"file": plain.name, "webp": webp.name, "width": v.width, "height": v.height}
+    return out
@@ -1,8 +1,11 @@
 # main.py — FastAPI backend + Telegram bot (PTB 21.x) lifecycle ichida
 import asyncio
+import hashlib
+import json
 import os
 import random
 import time
+import zlib
 from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
@@ -11,19 +14,21 @@ from dotenv import load_dotenv
 load_dotenv(Path(__file__).parent / ".env")
 
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, Header
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 from pydantic import BaseModel, field_validator
 
 import database as db
+import uploads
 from database import (
     save_registered_user,
     get_registered_user,
     get_coins,
-    spend_coins,
 )
 from bot import create_app, notify_new_order, notify_cancelled, send_otp
+from uploads import brotli  # ixtiyoriy (None — faqat gzip); .br yonfayllar bilan bitta manba
 
 # ───────────────────────────────────────────────────────────────
 # Telegram bot lifecycle (FastAPI lifespan)
@@ -31,11 +36,205 @@ from bot import create_app, notify_new_order, notify_cancelled, send_otp
 
 _bot_app = None
 _bot_polling_task = None
+_bot_leader = None  # bot_polling.lock — shu worker polling qilayotgan bo‘lsa ochiq fayl
+
+# --workers N: getUpdates faqat bitta workerda bo‘lishi kerak (aks holda Telegram 409 Conflict).
+# Qolganlari botni faqat xabar yuborish uchun ishga tushiradi va lider o‘lsa o‘rnini oladi.
+BOT_LEADER_RETRY = float(os.getenv("BOT_LEADER_RETRY", "15"))
+
+
+# ───────────────────────────────────────────────────────────────
+# Event loop lag — loop qancha vaqt bloklangani (/api/admin/metrics/loop)
+# ───────────────────────────────────────────────────────────────
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL_MS", "50")) / 1000
+
+
+class LoopLagMonitor:
+    """
+    Har interval’da uxlaydi: kechikib uyg‘ongan vaqt = loop shu payt boshqa ish
+    (sinxron disk I/O va h.k.) bilan band bo‘lgan vaqt. Worker (process) bo‘yicha.
+    """
+
+    BUCKETS_MS = (10, 50, 100, 500)
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.monotonic()
+        self.samples = 0
+        self.blocked = 0.0
+        self.max = 0.0
+        self.over = {b: 0 for b in self.BUCKETS_MS}
+
+    async def run(self) -> None:
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - t0 - self.interval)
+            self.samples += 1
+            self.blocked += lag
+            self.max = max(self.max, lag)
+            for b in self.BUCKETS_MS:
+                if lag * 1000 >= b:
+                    self.over[b] += 1
+
+    def snapshot(self) -> dict:
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "pid":              os.getpid(),
+            "interval_ms":      round(self.interval * 1000, 1),
+            "window_s":         round(uptime, 1),
+            "samples":          self.samples,
+            "blocked_ms_total": round(self.blocked * 1000, 1),
+            "blocked_ratio":    round(self.blocked / uptime, 4),
+            "max_ms":           round(self.max * 1000, 1),
+            "over_ms":          {str(b): n for b, n in self.over.items()},
+        }
+
+
+loop_lag = LoopLagMonitor(LOOP_LAG_INTERVAL)
+_loop_lag_task = None
+
+
+# ───────────────────────────────────────────────────────────────
+# JSON javoblarni siqish (gzip / br) — /api/admin/metrics/compression
+# ───────────────────────────────────────────────────────────────
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_THREAD_BYTES = 256 * 1024   # bundan kattasini loopdan tashqarida siqamiz
+_COMPRESSIBLE = ("application/json", "text/")
+
+
+def _pick_encoding(accept_encoding: str | None) -> str | None:
+    """Accept-Encoding → "br" | "gzip" | None (q=0 bilan rad etilganlari hisobga olinadi)."""
+    return uploads.pick_encoding(accept_encoding, ("br", "gzip") if brotli is not None else ("gzip",))
+
+
+def _compress(body: bytes, coding: str, best: bool = False) -> bytes:
+    """best=True — keshlanadigan javoblar uchun (bir marta siqiladi, sekinroq bo‘lsa ham)."""
+    if coding == "br":
+        return brotli.compress(body, quality=11 if best else 5)
+    z = zlib.compressobj(9 if best else 6, zlib.DEFLATED, 31)  # 31 → gzip konteyner
+    return z.compress(body) + z.flush()
+
+
+class CompressionStats:
+    """Route bo‘yicha: nechta javob, siqilgani, keshdan berilgani, baytlar va siqish vaqti."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.monotonic()
+        self.routes: dict[str, dict] = {}
+
+    def record(self, route: str, raw: int, sent: int, seconds: float, cached: bool = False) -> None:
+        r = self.routes.setdefault(route, {"responses": 0, "compressed": 0, "cached": 0,
+                                           "bytes_in": 0, "bytes_out": 0, "time": 0.0})
+        r["responses"] += 1
+        r["bytes_in"] += raw
+        r["bytes_out"] += sent
+        if sent != raw or cached:
+            r["compressed"] += 1
+        if cached:
+            r["cached"] += 1
+        r["time"] += seconds
+
+    def snapshot(self) -> dict:
+        return {
+            "pid":      os.getpid(),
+            "window_s": round(time.monotonic() - self.started, 1),
+            "routes": {
+                route: {
+                    "responses":  r["responses"],
+                    "compressed": r["compressed"],
+                    "cached":     r["cached"],
+                    "bytes_in":   r["bytes_in"],
+                    "bytes_out":  r["bytes_out"],
+                    "ratio":      round(r["bytes_out"] / r["bytes_in"], 3) if r["bytes_in"] else None,
+                    "time_ms":    round(r["time"] * 1000, 2),
+                }
+                for route, r in sorted(self.routes.items())
+            },
+        }
+
+
+compression_stats = CompressionStats()
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return f"{scope['method']} {route.path}" if route is not None else "other"
+
+
+class CompressionMiddleware:
+    """
+    Sof ASGI middleware: JSON/text javob COMPRESS_MIN_BYTES dan katta bo‘lsa va mijoz
+    qabul qilsa — br yoki gzip. Allaqachon Content-Encoding li javoblarga (menyu keshi)
+    tegmaydi. Siqilgan javob ETag’i W/ (weak) bo‘ladi — If-None-Match baribir ishlaydi.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = _pick_encoding(Headers(scope=scope).get("accept-encoding"))
+        start = None
+
+        async def _send(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:  # bodysiz / allaqachon yuborilgan
+                await send(message)
+                return
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            if (
+                not message.get("more_body", False)
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(_COMPRESSIBLE)
+            ):
+                route = _route_label(scope)
+                if coding is None or len(body) < COMPRESS_MIN_BYTES:
+                    compression_stats.record(route, len(body), len(body), 0.0)
+                else:
+                    t0 = time.perf_counter()
+                    if len(body) > COMPRESS_THREAD_BYTES:
+                        packed = await asyncio.to_thread(_compress, body, coding)
+                    else:
+                        packed = _compress(body, coding)
+                    compression_stats.record(route, len(body), len(packed), time.perf_counter() - t0)
+                    headers["Content-Encoding"] = coding
+                    headers["Content-Length"] = str(len(packed))
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        headers["ETag"] = f"W/{etag}"
+                    message = {**message, "body": packed}
+                if len(body) >= COMPRESS_MIN_BYTES and "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, _send)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _bot_app, _bot_polling_task
+    global _bot_app, _bot_polling_task, _loop_lag_task, _bot_leader
+
+    db.warm_up()
+    loop_lag.reset()
+    _loop_lag_task = asyncio.create_task(loop_lag.run())
+    uploads.start_gc()
 
     token = os.getenv("BOT_TOKEN", "")
     if token:
@@ -44,8 +243,14 @@ async def lifespan(app: FastAPI):
         await _bot_app.start()
 
         async def _poll():
+            global _bot_leader
+            while _bot_leader is None:
+                _bot_leader = db.try_acquire_leadership("bot_polling")
+                if _bot_leader is None:
+                    await asyncio.sleep(BOT_LEADER_RETRY)
             # updater start_polling PTB 21.x
             await _bot_app.updater.start_polling(drop_pending_updates=True)
+            print(f"🤖 Bot polling shu workerda (pid {os.getpid()})")
 
         _bot_polling_task = asyncio.create_task(_poll())
         print("🤖 Admin bot ishga tushdi")
@@ -66,12 +271,21 @@ async def lifespan(app: FastAPI):
         await _bot_app.stop()
         await _bot_app.shutdown()
 
+        if _bot_leader is not None:
+            _bot_leader.close()
+            _bot_leader = None  # keyingi lifespan liderlikni qaytadan so‘rasin
+
+    _loop_lag_task.cancel()
+    await uploads.shutdown()
+    db.shutdown()
+
 
 app = FastAPI(title="KFC Backend", lifespan=lifespan)
 
 # ───────────────────────────────────────────────────────────────
 from fastapi.middleware.cors import CORSMiddleware
 
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -84,11 +298,8 @@ app.add_middleware(
 # Static files (uploaded images)
 # ───────────────────────────────────────────────────────────────
 
-_UPLOADS_DIR = db.DATA_DIR / "uploads" / "menu"
-_UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-_CAT_UPLOADS_DIR = db.DATA_DIR / "uploads" / "menu" / "categories"
-_CAT_UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(db.DATA_DIR / "uploads")), name="static")
+(uploads.UPLOADS_ROOT / "menu" / "categories").mkdir(parents=True, exist_ok=True)
+app.mount("/static", uploads.ImmutableStaticFiles(directory=str(uploads.UPLOADS_ROOT)), name="static")
 
 
 # ───────────────────────────────────────────────────────────────
@@ -199,7 +410,7 @@ async def notify_after_delay(order_id: str, delay: int = 65):
     Cancel oynasi 55s. Admin 65s keyin ko'radi.
     """
     await asyncio.sleep(delay)
-    order = db.get_by_id(order_id)
+    order = await db.aio.get_by_id(order_id)
     if order and order.get("status") != "cancelled":
         await notify_new_order(order)
 
@@ -213,12 +424,49 @@ def health():
     return {"ok": True, "time": datetime.utcnow().isoformat()}
 
 
+@app.get("/api/admin/metrics/loop")
+def loop_metrics(reset: bool = False, x_admin_key: str | None = Header(default=None)):
+    """Event loop bloklangan vaqt (shu worker). reset=true — o‘lchovni qaytadan boshlaydi."""
+    require_admin(x_admin_key)
+    snap = loop_lag.snapshot()
+    if reset:
+        loop_lag.reset()
+    return snap
+
+
+@app.get("/api/admin/metrics/compression")
+def compression_metrics(reset: bool = False, x_admin_key: str | None = Header(default=None)):
+    """Route bo‘yicha siqish: bytes_in/out, ratio, vaqt, keshdan berilgan (shu worker)."""
+    require_admin(x_admin_key)
+    snap = compression_stats.snapshot()
+    if reset:
+        compression_stats.reset()
+    return snap
+
+
+@app.post("/api/admin/uploads/gc")
+async def uploads_gc(
+    dry_run: bool = True,
+    after: str = "",
+    limit: int = uploads.UPLOAD_GC_BATCH,
+    x_admin_key: str | None = Header(default=None),
+):
+    """
+    Menyuda havolasi yo‘q yuklangan rasmlar, bir batch. dry_run=false — o‘chiradi.
+    Javobdagi "next" ni keyingi so‘rovga after= qilib bering (null — hammasi ko‘rildi).
+    """
+    require_admin(x_admin_key)
+    if limit < 1:
+        raise HTTPException(400, "limit must be >= 1")
+    return await asyncio.to_thread(uploads.collect_garbage, dry_run, after, limit)
+
+
 @app.get("/api/check-phone")
 async def check_phone(phone: str):
     p = _norm_phone(phone)
     if not p:
         raise HTTPException(400, "phone required")
-    return {"exists": get_registered_user(p) is not None}
+    return {"exists": await db.aio.get_registered_user(p) is not None}
 
 
 @app.post("/api/otp/send")
@@ -232,7 +480,7 @@ async def otp_send(body: OtpSendRequest):
         raise HTTPException(400, detail={"error": "bad_mode", "message": "mode faqat login/signup bo'lishi kerak"})
 
     # Telegram botda borligini tekshiramiz
-    tg_user = db.get_telegram_user(phone)
+    tg_user = await db.aio.get_telegram_user(phone)
     if not tg_user:
         raise HTTPException(
             status_code=404,
@@ -242,7 +490,7 @@ async def otp_send(body: OtpSendRequest):
             }
         )
 
-    is_registered = get_registered_user(phone) is not None
+    is_registered = await db.aio.get_registered_user(phone) is not None
 
     if mode == "signup" and is_registered:
         raise HTTPException(
@@ -257,7 +505,7 @@ async def otp_send(body: OtpSendRequest):
         )
 
     # OTP cooldown (db.save_otp created_at qo'shgan)
-    existing = db.get_otp(phone)
+    existing = await db.aio.get_otp(phone)
     if existing:
         sent_ago = time.time() - float(existing.get("created_at", 0) or 0)
         if sent_ago < 60:
@@ -268,7 +516,7 @@ async def otp_send(body: OtpSendRequest):
 
     code = str(random.randint(100000, 999999))
     expires_at = time.time() + 5 * 60
-    db.save_otp(phone=phone, code=code, expires_at=expires_at, mode=mode)
+    await db.aio.save_otp(phone=phone, code=code, expires_at=expires_at, mode=mode)
 
     try:
         await send_otp(chat_id=int(tg_user["chat_id"]), code=code)
@@ -373,14 +621,9 @@ def get_profile(phone: str):
 
 @app.post("/api/orders", status_code=201)
 async def place_order(body: OrderCreate):
-    # DB counter orqali ID
-    num = db.next_order_number()
-    order_id = db.order_id_from_number(num)
-
     phone = _norm_phone(body.phone)
 
     order_dict = {
-        "id": order_id,
         "created_at": body.date or datetime.utcnow().isoformat(),
         "address": body.address,
         "items": [i.model_dump() for i in body.items],
@@ -395,32 +638,42 @@ async def place_order(body: OrderCreate):
         "comment": body.comment,
     }
 
+    # ID (DB counter) + zakaz + coin yechish — bitta amal; coin yetmasa zakaz yaratilmaydi
     try:
-        order = db.create(order_dict)
+        order = await db.aio.place_order(order_dict, coins_used=int(body.coins_used or 0))
     except ValueError as e:
         if "DUPLICATE_ID" in str(e):
             raise HTTPException(409, "Bu ID bilan zakaz allaqachon bor")
+        if "Yetarli coin" in str(e):
+            raise HTTPException(400, detail={"error": "not_enough_coins", "message": "Coin yetarli emas"})
         raise HTTPException(400, str(e))
 
-    # coin sarflash (agar ishlatilgan bo'lsa)
-    if phone and body.coins_used and int(body.coins_used) > 0:
-        try:
-            spend_coins(phone=phone, amount=int(body.coins_used), order_id=order_id)
-        except ValueError:
-            # yetarli coin bo'lmasa — discount bermaymiz (frontda ham tekshirgan yaxshi)
-            pass
-
     # admin notify (cancel oynasidan keyin)
-    asyncio.create_task(notify_after_delay(order_id))
+    asyncio.create_task(notify_after_delay(order["id"]))
     return {"success": True, "orderId": order["id"], "status": "pending"}
 
 
 @app.get("/api/orders")
-def list_orders(status: str | None = None, phone: str | None = None, limit: int = 50, offset: int = 0):
+def list_orders(
+    status: str | None = None,
+    phone: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    cursor: str | None = None,
+):
+    """
+    offset — eski usul. cursor — keyset sahifalash: javobdagi next_cursor ni
+    keyingi so‘rovga bering (oxirgi sahifada next_cursor = null).
+    """
     p = _norm_phone(phone) if phone else None
-    orders = db.get_all(status=status, phone=p, limit=limit, offset=offset)
+    try:
+        orders, next_cursor = db.get_page(status=status, phone=p, limit=limit, offset=offset, cursor=cursor)
+    except ValueError as e:
+        if "BAD_CURSOR" in str(e):
+            raise HTTPException(400, "Noto'g'ri cursor")
+        raise
     total = db.count(status=status, phone=p)
-    return {"orders": orders, "total": total}
+    return {"orders": orders, "total": total, "next_cursor": next_cursor}
 
 
 @app.get("/api/orders/{order_id}")
@@ -433,7 +686,7 @@ def get_order(order_id: str):
 
 @app.patch("/api/orders/{order_id}/cancel")
 async def cancel_order(order_id: str):
-    order = db.get_by_id(order_id)
+    order = await db.aio.get_by_id(order_id)
     if not order:
         raise HTTPException(404, "Zakaz topilmadi")
 
@@ -453,7 +706,7 @@ async def cancel_order(order_id: str):
     if elapsed > 55:
         raise HTTPException(400, "Bekor qilish vaqti o'tdi (55 sekund)")
 
-    updated = db.update_status(order_id, "cancelled") or order
+    updated = await db.aio.update_status(order_id, "cancelled") or order
     asyncio.create_task(notify_cancelled(updated))
     return {"success": True, "status": "cancelled"}
 
@@ -467,27 +720,141 @@ def get_user_coins(phone: str):
     return {"phone": p, "balance": balance, "sum_value": balance * 1000}
 
 
+@app.get("/api/coins/history")
+def get_user_coins_history(phone: str, cursor: str | None = None, limit: int = 20):
+    """
+    Coin tarixi yangidan eskiga. Keyingi sahifa uchun javobdagi next_cursor ni bering
+    (oxirgi sahifada next_cursor = null).
+    """
+    p = _norm_phone(phone)
+    if not p:
+        raise HTTPException(400, "phone required")
+    try:
+        items, next_cursor = db.coins_history(p, cursor=cursor, limit=max(1, min(limit, 100)))
+    except ValueError as e:
+        if "BAD_CURSOR" in str(e):
+            raise HTTPException(400, "Noto'g'ri cursor")
+        raise
+    return {"phone": p, "history": items, "next_cursor": next_cursor}
+
+
 # ───────────────────────────────────────────────────────────────
 # Menu: Public endpoints
 # ───────────────────────────────────────────────────────────────
 
+# Har variant (endpoint, category, active_only) uchun tayyor JSON baytlari + strong ETag.
+# Kalit (db.menu_version(), ...) — admin CRUD har yozuvda oshiradi, shunda kesh butunlay tashlanadi.
+# Versiya kalitda: eski versiyada boshlangan so‘rov kech tugasa ham yangi versiya nomidan berilmaydi.
+# ETag kontent hash’i: hamma workerlarda bir xil, brauzer/CDN 304 oladi.
+# qiymat: (etag, identity bytes, {"br"/"gzip": siqilgan bytes})
+_menu_cache: dict[tuple, tuple[str, bytes, dict[str, bytes]]] = {}
+_menu_cache_version: int | None = None
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _menu_response(key: tuple, build, request: Request) -> Response:
+    """
+    Versiya bo‘yicha keshlangan JSON bytes + ETag/304. Siqilgan (br/gzip) variantlar ham
+    keshda: har versiyada bir marta eng yuqori darajada siqiladi, keyin tayyor beriladi.
+    """
+    global _menu_cache_version
+    version = db.menu_version()
+    if _menu_cache_version is None or version > _menu_cache_version:
+        _menu_cache.clear()
+        _menu_cache_version = version
+    key = (version, *key)
+    hit = _menu_cache.get(key)
+    if hit is None:
+        body = json.dumps(jsonable_encoder(build()), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        hit = (f'"{hashlib.sha256(body).hexdigest()[:32]}"', body, {})
+        # build() paytida menyu o‘zgargan bo‘lsa — natija faqat shu so‘rovga, keshga emas
+        if version == _menu_cache_version == db.menu_version():
+            _menu_cache[key] = hit
+    etag, body, encoded = hit
+
+    coding = None
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        coding = _pick_encoding(request.headers.get("accept-encoding"))
+        headers["Vary"] = "Accept-Encoding"
+    if coding:
+        headers["ETag"] = f"W/{etag}"
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    route = _route_label(request.scope)
+    if coding is None:
+        compression_stats.record(route, len(body), len(body), 0.0)
+        return Response(content=body, media_type="application/json", headers=headers)
+    packed = encoded.get(coding)
+    t0 = time.perf_counter()
+    if packed is None:
+        packed = encoded[coding] = _compress(body, coding, best=True)
+        compression_stats.record(route, len(body), len(packed), time.perf_counter() - t0)
+    else:
+        compression_stats.record(route, len(body), len(packed), 0.0, cached=True)
+    headers["Content-Encoding"] = coding
+    return Response(content=packed, media_type="application/json", headers=headers)
+
+
+@app.get("/api/menu")
+def get_menu(
+    request: Request,
+    since: int | None = None,
+    active_only: bool = True,
+):
+    """
+    Butun menyu bitta so‘rovda: kategoriyalar ichida taomlari bilan + version.
+    since=<oldingi version> — faqat o‘zgarganlar (full=false); log yetmasa to‘liq (full=true).
+    """
+    if since is not None and not db.menu_since_in_log(since):
+        since = None  # logdan tashqari since’lar bitta to‘liq snapshot kalitiga — kesh cheksiz o‘smasin
+    return _menu_response(
+        ("menu", active_only, since),
+        lambda: db.menu_snapshot(active_only=active_only, since=since),
+        request,
+    )
+
+
 @app.get("/api/menu/categories")
-def get_menu_categories(active_only: bool = True):
-    return db.menu_get_categories(active_only=active_only)
+def get_menu_categories(request: Request, active_only: bool = True):
+    return _menu_response(
+        ("categories", active_only),
+        lambda: db.menu_get_categories(active_only=active_only),
+        request,
+    )
 
 
 @app.get("/api/menu/foods")
-def get_menu_foods(category: str | None = None, search: str | None = None, active_only: bool = True):
-    return db.menu_get_foods(category=category, search=search, active_only=active_only)
+def get_menu_foods(
+    request: Request,
+    category: str | None = None,
+    search: str | None = None,
+    active_only: bool = True,
+):
+    if search:
+        # qidiruv so‘rovlari cheksiz — keshlanmaydi
+        return db.menu_get_foods(category=category, search=search, active_only=active_only)
+    if category is not None and category not in db.menu_category_keys():
+        # noma'lum kategoriya ham cheksiz — faqat mavjud kalitlar keshlanadi
+        return db.menu_get_foods(category=category, active_only=active_only)
+    return _menu_response(
+        ("foods", category, active_only),
+        lambda: db.menu_get_foods(category=category, active_only=active_only),
+        request,
+    )
 
 
 # ───────────────────────────────────────────────────────────────
 # Menu: Admin CRUD (requires X-Admin-Key header)
 # ───────────────────────────────────────────────────────────────
 
-import uuid as _uuid
-
-
 @app.post("/api/menu/categories", status_code=201)
 async def create_category(
     key: str = Form(...),
@@ -501,18 +868,15 @@ async def create_category(
     active = is_active.lower() in ("true", "1", "yes")
     image_url = ""
     if image and image.filename:
-        ext = Path(image.filename).suffix or ".jpg"
-        fname = f"{_uuid.uuid4().hex}{ext}"
-        dest = _CAT_UPLOADS_DIR / fname
-        dest.write_bytes(await image.read())
-        image_url = f"/static/menu/categories/{fname}"
-    cat = db.menu_create_category({
+        image_url = await uploads.save_image(image, "menu/categories")
+    cat = await db.aio.menu_create_category({
         "key": key.strip(),
         "title": title.strip(),
         "sort_order": sort_order,
         "is_active": active,
         "image_url": image_url,
     })
+    uploads.schedule_variants(image_url)
     return cat
 
 
@@ -537,14 +901,11 @@ async def update_category(
     if is_active is not None:
         patch["is_active"] = is_active.lower() in ("true", "1", "yes")
     if image and image.filename:
-        ext = Path(image.filename).suffix or ".jpg"
-        fname = f"{_uuid.uuid4().hex}{ext}"
-        dest = _CAT_UPLOADS_DIR / fname
-        dest.write_bytes(await image.read())
-        patch["image_url"] = f"/static/menu/categories/{fname}"
-    result = db.menu_update_category(cat_id, patch)
+        patch["image_url"] = await uploads.save_image(image, "menu/categories")
+    result = await db.aio.menu_update_category(cat_id, patch)
     if not result:
         raise HTTPException(404, "Category not found")
+    uploads.schedule_variants(patch.get("image_url", ""))
     return result
 
 
@@ -580,15 +941,11 @@ async def create_food(
     require_admin(x_admin_key)
     image_value = ""
     if image and image.filename:
-        ext = Path(image.filename).suffix or ".jpg"
-        fname = f"{_uuid.uuid4().hex}{ext}"
-        dest = _UPLOADS_DIR / fname
-        dest.write_bytes(await image.read())
-        image_value = f"/static/menu/{fname}"
+        image_value = await uploads.save_image(image, "menu")
     elif image_emoji:
         image_value = image_emoji.strip()
 
-    food = db.menu_create_food({
+    food = await db.aio.menu_create_food({
         "name": name.strip(),
         "fullName": (fullName or "").strip() or None,
         "description": (description or "").strip(),
@@ -597,6 +954,7 @@ async def create_food(
         "image": image_value,
         "is_active": is_active,
     })
+    uploads.schedule_variants(image_value)
     return food
 
 
@@ -629,17 +987,14 @@ async def update_food(
         patch["is_active"] = is_active
 
     if image and image.filename:
-        ext = Path(image.filename).suffix or ".jpg"
-        fname = f"{_uuid.uuid4().hex}{ext}"
-        dest = _UPLOADS_DIR / fname
-        dest.write_bytes(await image.read())
-        patch["image"] = f"/static/menu/{fname}"
+        patch["image"] = await uploads.save_image(image, "menu")
     elif image_emoji is not None:
         patch["image"] = image_emoji.strip()
 
-    result = db.menu_update_food(food_id, patch)
+    result = await db.aio.menu_update_food(food_id, patch)
     if not result:
         raise HTTPException(404, "Food not found")
+    uploads.schedule_variants(patch.get("image", ""))
     return result
 
 
@@ -0,0 +1,17 @@
+"""
+Testlar uchun umumiy sozlama: database / main import qilinishidan oldin DATA_DIR
+vaqtinchalik papkaga yo‘naltiriladi — loyiha papkasidagi jsonlarga tegilmaydi.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="kfc-test-")
+os.environ.setdefault("ADMIN_KEY", "test-key")
+os.environ.setdefault("UPLOAD_GC_INTERVAL", "0")
+
+sys.path.insert(0, str(ROOT))
@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import database as db
+from conftest import ROOT
+
+
+def _set_coins_file(records):
+    db._write_json_file(db._COINS_FILE, records)
+
+
+def _records(phone):
+    with db._coins_lock:
+        data, _ = db._coins_indexed()
+        return [r for r in data if r.get("phone") == phone]
+
+
+def test_reconcile_matches_ledger_by_record_not_filename():
+    phone = "+998 90 1234567"
+    db.add_coins(phone, 7, "rec-1")
+    assert db.get_coins(phone) == 7
+
+    # crash imitatsiyasi: ledger yozildi, coins.json esa eski holatda qoldi
+    with db._coins_lock:
+        data, _ = db._coins_indexed()
+        stale = [dict(r, balance=0) if r.get("phone") == phone else dict(r) for r in data]
+    _set_coins_file(stale)
+    db._coins_reconcile()
+
+    recs = _records(phone)
+    assert [r["balance"] for r in recs] == [7]
+    assert not _records("+998_90_1234567")
+
+
+def test_reconcile_legacy_ledger_without_phone_field():
+    phone = "+998 91 7654321"
+    db.COINS_LEDGER_DIR.mkdir(parents=True, exist_ok=True)
+    db._ledger_path(phone).write_text(
+        json.dumps({"type": "earn", "amount": 5, "order_id": "x", "balance": 5}) + "\n", encoding="utf-8"
+    )
+    with db._coins_lock:
+        data, _ = db._coins_indexed()
+        records = [dict(r) for r in data] + [{"phone": phone, "balance": 0}]
+    _set_coins_file(records)
+    db._coins_reconcile()
+    assert [r["balance"] for r in _records(phone)] == [5]
+    assert not _records("+998_91_7654321")
+
+
+def test_reconcile_restores_new_phone_from_ledger_entry():
+    phone = "+998 93 1112233"
+    db.add_coins(phone, 3, "rec-2")
+    with db._coins_lock:
+        data, _ = db._coins_indexed()
+        without = [dict(r) for r in data if r.get("phone") != phone]
+    _set_coins_file(without)
+    db._coins_reconcile()
+    assert [r["balance"] for r in _records(phone)] == [3]
+
+
+def test_shutdown_writes_pending_coin_debit(tmp_path):
+    """Group commit’da kutib turgan coin yozuvini shutdown() diskka yozishi shart."""
+    phone = "+998940001122"
+    code = textwrap.dedent(f"""
+        import os
+        import database as db
+        db.warm_up()
+        db.add_coins("{phone}", 5, "seed")
+        db._coins_commit.window = 60  # fon flush shutdown’gacha yetib kelmaydi
+        with db._coins_lock:
+            db._coins_apply("{phone}", 2, "spend", "o-1")
+        db.shutdown()
+        os._exit(0)
+    """)
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "DATA_DIR": str(tmp_path)}
+    p = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=120)
+    assert p.returncode == 0, p.stderr
+
+    # startup redo’siz, to‘g‘ridan-to‘g‘ri diskdagi holat
+    coins = json.loads((tmp_path / "coins.json").read_text(encoding="utf-8"))
+    assert [r["balance"] for r in coins if r["phone"] == phone] == [3]
+    ledger = (tmp_path / "coins_ledger" / f"{phone}.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["type"] for line in ledger] == ["earn", "spend"]
+
+
+def test_failed_ledger_write_keeps_debit_through_compaction(monkeypatch, tmp_path):
+    phone = "+998950004455"
+    db.add_coins(phone, 5, "seed")
+
+    (tmp_path / "not-a-dir").write_text("")
+    monkeypatch.setattr(db, "COINS_LEDGER_DIR", tmp_path / "not-a-dir" / "ledger")  # mkdir yiqiladi
+    with pytest.raises(OSError):
+        db.place_order({"phone": phone, "items": [], "total": 1}, coins_used=2)
+    monkeypatch.undo()
+
+    # zakaz bor, coin yechilmagan; compaction logni qisqartirsa ham debit yo‘qolmaydi
+    db._orders.compact()
+    pending = [d for d in db._orders.coin_debits() if d[1] == phone]
+    assert pending and pending[0][2] == 2
+    assert db.get_coins(phone) == 5
+
+    db._coins_redo_debits()  # startup
+    assert db.get_coins(phone) == 3
+    assert not [d for d in db._orders.coin_debits() if d[1] == phone]
+
+
+def test_confirmed_debit_is_cleared():
+    phone = "+998950006677"
+    db.add_coins(phone, 4, "seed")
+    order = db.place_order({"phone": phone, "items": [], "total": 1}, coins_used=3)
+    assert db.get_coins(phone) == 1
+    assert order["id"] not in [d[0] for d in db._orders.coin_debits()]
+    assert "coins_debit" not in db.get_by_id(order["id"])
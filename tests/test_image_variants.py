@@ -0,0 +1,73 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database as db
+import imaging
+import main
+import uploads
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _image(size, mode="RGB", fmt="JPEG") -> bytes:
+    buf = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)).save(buf, fmt)
+    return buf.getvalue()
+
+
+def test_make_variants_sizes_and_formats(tmp_path):
+    src = tmp_path / ("a" * 32 + ".jpg")
+    src.write_bytes(_image((2000, 1000)))
+
+    made = imaging.make_variants(str(src))
+
+    assert set(made) == {name for name, _ in imaging.VARIANTS}
+    for name, limit in imaging.VARIANTS:
+        v = made[name]
+        assert max(v["width"], v["height"]) == limit
+        assert v["file"].endswith(".jpg") and v["webp"].endswith(".webp")
+        with Image.open(tmp_path / v["file"]) as im:
+            assert im.size == (v["width"], v["height"])
+        assert (tmp_path / v["webp"]).exists()
+
+    # qayta chaqiruv mavjud fayllarni qayta yozmaydi
+    stamp = (tmp_path / made["card"]["file"]).stat().st_mtime_ns
+    imaging.make_variants(str(src))
+    assert (tmp_path / made["card"]["file"]).stat().st_mtime_ns == stamp
+
+
+def test_transparent_png_stays_png_and_small_is_not_upscaled(tmp_path):
+    src = tmp_path / ("b" * 32 + ".png")
+    src.write_bytes(_image((100, 80), "RGBA", "PNG"))
+
+    made = imaging.make_variants(str(src))
+
+    assert all(v["file"].endswith(".png") for v in made.values())
+    assert all((v["width"], v["height"]) == (100, 80) for v in made.values())
+
+
+def test_upload_gets_variants_attached(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOADS_ROOT", tmp_path)
+    with TestClient(main.app) as client:  # lifespan oxirida uploads.shutdown() variantlarni kutadi
+        r = client.post(
+            "/api/menu/foods",
+            data={"name": "Variant", "price": "1", "category": "variants-test"},
+            files={"image": ("big.jpg", _image((1600, 1600)), "image/jpeg")},
+            headers={"X-Admin-Key": "test-key"},
+        )
+        assert r.status_code == 201, r.text
+        food_id = r.json()["id"]
+
+    try:
+        food = next(f for f in db.menu_get_foods() if f["id"] == food_id)
+        variants = food["image_variants"]
+        assert set(variants) == {"thumb", "card", "full"}
+        assert variants["card"]["width"] == 480
+        for v in variants.values():
+            for url in (v["url"], v["webp"]):
+                assert url.startswith("/static/menu/")
+                assert (tmp_path / url[len("/static/"):]).is_file()
+    finally:
+        db.menu_delete_food(food_id)
@@ -0,0 +1,33 @@
+import os
+import time
+
+import database as db
+
+
+def test_recent_file_is_reparsed_even_if_key_matches(tmp_path):
+    """Bir tick ichida bir xil inode/size/mtime bilan qayta yozilgan fayl eski qiymat bermasin."""
+    path = tmp_path / "balances.json"
+    stamp = time.time_ns()
+    path.write_text('{"b": 1}', encoding="utf-8")
+    os.utime(path, ns=(stamp, stamp))
+    assert db._read_json_cached(path, dict) == {"b": 1}
+
+    path.write_text('{"b": 2}', encoding="utf-8")  # o‘sha inode, o‘sha o‘lcham
+    os.utime(path, ns=(stamp, stamp))
+    assert db._read_json_cached(path, dict) == {"b": 2}
+
+
+def test_settled_file_is_served_from_cache(tmp_path):
+    path = tmp_path / "menu.json"
+    path.write_text('[{"id": 1}]', encoding="utf-8")
+    old = time.time_ns() - 10 * db._RACY_NS
+    os.utime(path, ns=(old, old))
+    first = db._read_json_cached(path)
+    assert db._read_json_cached(path) is first
+
+
+def test_own_write_is_not_reparsed(tmp_path):
+    path = tmp_path / "users.json"
+    data = [{"phone": "+998900000001"}]
+    db._write_json_file(path, data, durable=False)
+    assert db._read_json_cached(path) is data
@@ -0,0 +1,55 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _order():
+    return {
+        "phone": "+998901234567",
+        "address": "Toshkent",
+        "items": [{"name": "Burger", "price": 60000, "quantity": 1}],
+        "total": 60000,
+    }
+
+
+def test_app_survives_second_lifespan():
+    for _ in range(2):
+        with TestClient(main.app) as c:
+            r = c.post("/api/orders", json=_order())
+            assert r.status_code == 201, r.text
+
+
+class _FakeUpdater:
+    def __init__(self, polls):
+        self.polls = polls
+
+    async def start_polling(self, **kw):
+        self.polls.append(kw)
+
+    async def stop(self):
+        pass
+
+
+class _FakeBot:
+    def __init__(self, polls):
+        self.updater = _FakeUpdater(polls)
+
+    async def initialize(self):
+        pass
+
+    start = stop = shutdown = initialize
+
+
+def test_bot_polling_restarts_on_second_lifespan(monkeypatch):
+    polls = []
+    monkeypatch.setenv("BOT_TOKEN", "test")
+    monkeypatch.setattr(main, "create_app", lambda: _FakeBot(polls))
+    for n in (1, 2):
+        with TestClient(main.app):
+            deadline = time.monotonic() + 5
+            while len(polls) < n and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert len(polls) == n
+    assert main._bot_leader is None
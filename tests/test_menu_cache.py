@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import database as db
+import main
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def food():
+    f = db.menu_create_food({"name": "Old name", "price": 1, "category": "cache-test"})
+    yield f
+    db.menu_delete_food(f["id"])
+
+
+def _names(client):
+    return {f["id"]: f["name"] for f in client.get("/api/menu/foods", params={"category": "cache-test"}).json()}
+
+
+def test_update_invalidates_cache(client, food):
+    assert _names(client)[food["id"]] == "Old name"
+    db.menu_update_food(food["id"], {"name": "New name"})
+    assert _names(client)[food["id"]] == "New name"
+
+
+def test_build_racing_with_update_is_not_cached(client, food, monkeypatch):
+    """Eski fayllarni o‘qigan so‘rov versiya oshgandan keyin tugasa — natijasi keshda qolmasligi kerak."""
+    real = db.menu_get_foods
+
+    def stale_build(**kw):
+        old = [dict(f) for f in real(**kw)]
+        monkeypatch.setattr(db, "menu_get_foods", real)
+        db.menu_update_food(food["id"], {"name": "New name"})
+        # parallel so‘rov yangi versiyani o‘qib, keshni tozalab ulguradi
+        assert _names(client)[food["id"]] == "New name"
+        return old
+
+    monkeypatch.setattr(db, "menu_get_foods", stale_build)
+    assert _names(client)[food["id"]] == "Old name"
+    assert _names(client)[food["id"]] == "New name"
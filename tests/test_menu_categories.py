@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import database as db
+import main
+
+client = TestClient(main.app)
+
+
+def _count(key, active_only=False):
+    cats = {c["key"]: c for c in db.menu_get_categories(active_only=active_only)}
+    return cats[key]["food_count"]
+
+
+@pytest.fixture
+def cats():
+    made = [db.menu_create_category({"key": k, "title": k, "is_active": True}) for k in ("ci-a", "ci-b")]
+    yield
+    for f in db.menu_get_foods():
+        if f.get("category") in ("ci-a", "ci-b"):
+            db.menu_delete_food(f["id"])
+    for c in made:
+        db.menu_delete_category(c["id"])
+
+
+def test_category_index_tracks_create_update_delete(cats):
+    f1 = db.menu_create_food({"name": "A1", "price": 1, "category": "ci-a"})
+    f2 = db.menu_create_food({"name": "A2", "price": 1, "category": "ci-a", "is_active": False})
+    f3 = db.menu_create_food({"name": "A3", "price": 1, "category": "ci-a"})
+
+    assert [f["id"] for f in db.menu_get_foods(category="ci-a")] == [f1["id"], f2["id"], f3["id"]]
+    assert (_count("ci-a"), _count("ci-a", active_only=True)) == (3, 2)
+
+    db.menu_update_food(f3["id"], {"category": "ci-b"})
+    db.menu_update_food(f2["id"], {"is_active": True})
+    assert (_count("ci-a"), _count("ci-a", active_only=True)) == (2, 2)
+    assert [f["id"] for f in db.menu_get_foods(category="ci-b")] == [f3["id"]]
+
+    db.menu_delete_food(f1["id"])
+    assert _count("ci-a") == 1 and _count("ci-b") == 1
+
+
+def test_category_with_foods_cannot_be_deleted(cats):
+    food = db.menu_create_food({"name": "B1", "price": 1, "category": "ci-b"})
+    cat_id = next(c["id"] for c in db.menu_get_categories() if c["key"] == "ci-b")
+    with pytest.raises(ValueError, match="CATEGORY_HAS_FOODS"):
+        db.menu_delete_category(cat_id)
+    db.menu_delete_food(food["id"])
+    assert _count("ci-b") == 0
+
+
+def test_categories_endpoint_refreshes_food_count(cats):
+    def count():
+        body = client.get("/api/menu/categories", params={"active_only": "true"}).json()
+        return next(c["food_count"] for c in body if c["key"] == "ci-a")
+
+    assert count() == 0
+    db.menu_create_food({"name": "C1", "price": 1, "category": "ci-a"})
+    assert count() == 1
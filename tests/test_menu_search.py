@@ -0,0 +1,27 @@
+import database as db
+
+
+def _jaccard(a: str, b: str) -> float:
+    ga, gb = db._trigrams(a), db._trigrams(b)
+    return len(ga & gb) / len(ga | gb)
+
+
+def test_trigram_similarity_is_exact_jaccard():
+    index = db._FoodIndex([
+        {"id": 1, "name": "Zinger", "category": "burgers"},
+        {"id": 2, "name": "Twister", "category": "rolls"},
+    ])
+    scores = index._term_scores("zingre")
+    assert abs(scores[1] - 3.0 * _jaccard("zingre", "zinger")) < 1e-9
+    assert 2 not in scores
+
+
+def test_typo_ranked_after_prefix():
+    index = db._FoodIndex([
+        {"id": 1, "name": "Burger", "category": "x"},
+        {"id": 2, "name": "Burrito", "category": "x"},
+        {"id": 3, "name": "Lavash", "category": "x"},
+    ])
+    assert index.search("burg")[0] == 1
+    assert index.search("burgr")[0] == 1
+    assert 3 not in index.search("burgr")
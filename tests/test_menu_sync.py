@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import database as db
+import main
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+def test_since_delta_and_fallback(client):
+    cat = db.menu_create_category({"key": "sync-test", "title": "Sync", "is_active": True})
+    v0 = client.get("/api/menu").json()["version"]
+    food = db.menu_create_food({"name": "Delta", "price": 1, "category": "sync-test"})
+    try:
+        delta = client.get("/api/menu", params={"since": v0}).json()
+        assert delta["full"] is False
+        assert [f["id"] for f in delta["foods"]["upserted"]] == [food["id"]]
+        for since in (-5, 10 ** 9):
+            assert client.get("/api/menu", params={"since": since}).json()["full"] is True
+    finally:
+        db.menu_delete_food(food["id"])
+        db.menu_delete_category(cat["id"])
+
+
+def test_cache_keys_stay_bounded(client):
+    client.get("/api/menu")
+    client.get("/api/menu/foods")
+    before = len(main._menu_cache)
+    for i in range(200):
+        client.get("/api/menu", params={"since": 10 ** 6 + i})
+        client.get("/api/menu", params={"since": -i - 1})
+        client.get("/api/menu/foods", params={"category": f"no-such-{i}"})
+    assert len(main._menu_cache) == before
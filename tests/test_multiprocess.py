@@ -0,0 +1,190 @@
+"""
+Bir nechta worker (process) va crash holatlari: har stsenariy alohida python process’larda,
+o‘z DATA_DIR’ida ishlaydi — database moduli import paytida DATA_DIR’ni o‘qiydi.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from conftest import ROOT
+
+PHONE = "+998901112233"
+
+
+def _run(data_dir, code: str, **env) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-c", textwrap.dedent(code)],
+        cwd=str(ROOT),
+        env={**os.environ, "PYTHONPATH": str(ROOT), "DATA_DIR": str(data_dir), **env},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def _check(data_dir, code: str, **env) -> str:
+    p = _run(data_dir, code, **env)
+    out, err = p.communicate(timeout=120)
+    assert p.returncode == 0, err
+    return out
+
+
+def _state(data_dir, **env) -> dict:
+    """Toza process’da diskdan o‘qilgan holat."""
+    out = _check(data_dir, """
+        import json
+        import database as db
+        db.warm_up()
+        orders = db.get_all(limit=100000)
+        print(json.dumps({
+            "count": db.count(),
+            "ids": [o["id"] for o in orders],
+            "status": {o["id"]: o["status"] for o in orders},
+            "coins": db.get_coins("%s"),
+        }))
+    """ % PHONE, **env)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+# ═══════════════════════════════════════════════════════════════
+#  3 process × 100 zakaz
+# ═══════════════════════════════════════════════════════════════
+
+WORKER = """
+    import threading
+    import database as db
+
+    db.warm_up()
+    spent = []
+
+    def run(n):
+        for _ in range(n):
+            order = {"phone": "%s", "items": [], "total": 60000}
+            try:
+                db.place_order(order, coins_used=1)
+                spent.append(1)
+            except ValueError:
+                db.place_order(order, coins_used=0)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in (34, 33, 33)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    db.shutdown()  # uvicorn lifespan kabi
+    print(len(spent))
+""" % PHONE
+
+
+@pytest.mark.parametrize("backend, block", [("json", "1"), ("json", "5"), ("sqlite", "1")])
+def test_three_processes_hundred_orders_each(tmp_path, backend, block):
+    env = {"STORAGE_BACKEND": backend, "ORDER_ID_BLOCK": block}
+    _check(tmp_path, f"""
+        import database as db
+        db.warm_up()
+        db.add_coins("{PHONE}", 250, "seed")
+    """, **env)
+
+    procs = [_run(tmp_path, WORKER, **env) for _ in range(3)]
+    spent = 0
+    for p in procs:
+        out, err = p.communicate(timeout=120)
+        assert p.returncode == 0, err
+        spent += int(out.strip().splitlines()[-1])
+
+    state = _state(tmp_path, **env)
+    assert state["count"] == 300
+    assert len(state["ids"]) == 300 and len(set(state["ids"])) == 300
+    assert spent == 250             # balansdan ortiq sarflanmadi, lekin hammasi ishlatildi
+    assert state["coins"] == 0
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Crash: log replay va compaction
+# ═══════════════════════════════════════════════════════════════
+
+def test_crash_replays_log_over_snapshot(tmp_path):
+    """Compaction’siz o‘lgan process: snapshot yo‘q, hamma narsa logdan tiklanadi."""
+    _check(tmp_path, """
+        import os
+        import database as db
+        db.warm_up()
+        for i in range(20):
+            db.create({"id": f"c{i}", "phone": "+998900000000", "items": [], "total": 1})
+        for i in range(0, 20, 2):
+            db.update_status(f"c{i}", "done")
+        db.update_tg_msg_id("c1", 777)
+        os._exit(0)  # shutdown() / compaction chaqirilmaydi
+    """)
+    # oxirgi yozuv chala qolgan (yozish paytida o‘chgan) — tashlab yuborilishi kerak
+    with (tmp_path / "orders.log.jsonl").open("ab") as f:
+        f.write(b'{"op": "status_changed", "id": "c1", "sta')
+
+    state = _state(tmp_path)
+    assert state["count"] == 20
+    assert sum(s == "done" for s in state["status"].values()) == 10
+    assert state["status"]["c1"] != "done"
+    out = _check(tmp_path, """
+        import database as db
+        print(db.get_by_id("c1").get("tg_msg_id"))
+    """)
+    assert out.strip().splitlines()[-1] == "777"
+
+
+def test_compaction_then_crash_keeps_everything(tmp_path):
+    _check(tmp_path, """
+        import os
+        import database as db
+        db.warm_up()
+        for i in range(10):
+            db.create({"id": f"a{i}", "phone": "+998900000000", "items": [], "total": 1})
+        db._orders.compact()
+        for i in range(10, 15):
+            db.create({"id": f"a{i}", "phone": "+998900000000", "items": [], "total": 1})
+        db.update_status("a3", "cancelled")
+        os._exit(0)
+    """)
+    snapshot = json.loads((tmp_path / "orders.json").read_text(encoding="utf-8"))
+    assert len(snapshot) == 10
+    assert not (tmp_path / "orders.log.jsonl.1").exists()
+
+    state = _state(tmp_path)
+    assert state["count"] == 15
+    assert state["status"]["a3"] == "cancelled"
+
+
+def test_crash_between_log_rotation_and_snapshot(tmp_path):
+    """Compaction log’ni .1 ga aylantirib, snapshot yozishga ulgurmay o‘lgan holat."""
+    _check(tmp_path, """
+        import os
+        import database as db
+        db.warm_up()
+        for i in range(8):
+            db.create({"id": f"r{i}", "phone": "+998900000000", "items": [], "total": 1})
+        with db._lock:
+            db._orders._ensure()
+            db._orders._rotate_log()
+        db.create({"id": "r8", "phone": "+998900000000", "items": [], "total": 1})
+        db.update_status("r0", "done")
+        os._exit(0)
+    """)
+    assert (tmp_path / "orders.log.jsonl.1").exists()
+
+    state = _state(tmp_path)
+    assert state["count"] == 9
+    assert state["status"]["r0"] == "done"
+
+    # keyingi compaction hammasini snapshot’ga yig‘adi va .1 ni o‘chiradi
+    _check(tmp_path, """
+        import database as db
+        db.warm_up()
+        db._orders.compact()
+    """)
+    assert not (tmp_path / "orders.log.jsonl.1").exists()
+    assert len(json.loads((tmp_path / "orders.json").read_text(encoding="utf-8"))) == 9
+    assert _state(tmp_path)["count"] == 9
@@ -0,0 +1,34 @@
+import pytest
+
+import database as db
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        monkeypatch.setattr(db, "_orders", db._SqliteOrderStore(tmp_path / "kfc.db"))
+    return request.param
+
+
+def _snapshot():
+    monthly = db.stats_monthly()
+    monthly["users"] = sorted(monthly["users"], key=lambda u: u["phone"])
+    return db.stats_today(), monthly
+
+
+def test_incremental_stats_match_full_recount(store):
+    before, _ = _snapshot()
+    for i, total in enumerate((100, 200, 300)):
+        db.create({"id": f"st-{store}-{i}", "phone": f"+99890555000{i % 2}",
+                   "customer_name": "Stat", "items": [], "total": total})
+    db.update_status(f"st-{store}-2", "cancelled")
+    db.update_status(f"st-{store}-0", "done")
+
+    today, monthly = _snapshot()
+    assert today["total"] - before["total"] == 3
+    assert today["cancelled"] - before["cancelled"] == 1
+    assert today["done"] - before["done"] == 1
+    assert today["revenue"] - before["revenue"] == 300  # bekor qilingan 300 hisobga kirmaydi
+
+    db.rebuild_stats()
+    assert _snapshot() == (today, monthly)
@@ -0,0 +1,34 @@
+import database as db
+
+
+def test_compaction_fsyncs_snapshot_and_archive_before_dropping_log(monkeypatch):
+    """compact(): snapshot va arxiv durable yozilgandan keyingina eski log o‘chiriladi."""
+    if db.STORAGE_BACKEND != "json":
+        return
+    events = []
+    real_write, real_unlink = db._atomic_write, db.Path.unlink
+
+    def write(path, content, durable=False):
+        events.append(("write", path.name, durable))
+        real_write(path, content, durable)
+
+    def unlink(self, *a, **kw):
+        if self == db._DB_LOG_OLD:
+            events.append(("unlink", self.name, None))
+        return real_unlink(self, *a, **kw)
+
+    monkeypatch.setattr(db, "_atomic_write", write)
+    monkeypatch.setattr(db.Path, "unlink", unlink)
+
+    old = db.create({"id": "durable-old", "phone": "+998900000001", "items": [], "total": 1,
+                     "created_at": "2020-01-05T10:00:00"})
+    db.update_status(old["id"], "done")
+    db.create({"id": "durable-hot", "phone": "+998900000001", "items": [], "total": 1})
+    db._orders.compact()
+
+    writes = {name: durable for kind, name, durable in events if kind == "write"}
+    assert writes[db.DB_FILE.name] is True
+    assert writes["2020-01.json.gz"] is True and writes[db._ARCHIVE_MANIFEST.name] is True
+    order = [e[1] for e in events]
+    assert order.index(db.DB_FILE.name) < order.index(db._DB_LOG_OLD.name)
+    assert db.get_by_id("durable-old")["status"] == "done"
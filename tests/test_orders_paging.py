@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+import database as db
+import main
+
+client = TestClient(main.app)
+PHONE = "+998907770001"
+
+
+def _pages(limit, **params):
+    cursor, pages = None, []
+    while True:
+        q = {"phone": PHONE, "limit": limit, **params}
+        if cursor:
+            q["cursor"] = cursor
+        r = client.get("/api/orders", params=q)
+        assert r.status_code == 200, r.text
+        body = r.json()
+        pages.append([o["id"] for o in body["orders"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages, body["total"]
+
+
+def test_cursor_pages_cover_everything_once():
+    now = datetime.utcnow().isoformat()
+    # bir xil created_at — tartib id bo‘yicha ajratiladi
+    ids = [f"pg-{i}" for i in range(7)]
+    for oid in ids:
+        db.create({"id": oid, "phone": PHONE, "items": [], "total": 1, "created_at": now})
+
+    pages, total = _pages(3)
+    assert [len(p) for p in pages] == [3, 3, 1]
+    flat = [oid for p in pages for oid in p]
+    assert flat == sorted(ids, reverse=True)
+    assert total == 7
+
+
+def test_cursor_is_stable_when_new_orders_arrive():
+    phone = "+998907770002"
+    for i in range(4):
+        db.create({"id": f"st-{i}", "phone": phone, "items": [], "total": 1})
+    first = client.get("/api/orders", params={"phone": phone, "limit": 2}).json()
+    db.create({"id": "st-new", "phone": phone, "items": [], "total": 1})  # eng yangi — boshiga tushadi
+
+    r = client.get("/api/orders", params={"phone": phone, "limit": 2, "cursor": first["next_cursor"]})
+    assert [o["id"] for o in first["orders"]] == ["st-3", "st-2"]
+    assert [o["id"] for o in r.json()["orders"]] == ["st-1", "st-0"]
+
+
+def test_malformed_cursor_is_400():
+    for bad in ("not-a-cursor", "!!!", "W10"):  # W10 = base64("[]") — tuzilishi noto‘g‘ri
+        r = client.get("/api/orders", params={"cursor": bad})
+        assert r.status_code == 400, (bad, r.text)
@@ -0,0 +1,45 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import database as db
+import main
+
+client = TestClient(main.app)
+
+
+def test_expired_code_is_kept_for_grace_and_rejected():
+    phone = "+998908880001"
+    db.save_otp(phone, "1234", time.time() - 1)
+
+    # grace ichida yozuv hali turadi — sweeper unga tegmaydi
+    db._otp_sweep()
+    assert db.get_otp(phone) is not None
+
+    r = client.post("/api/otp/verify", json={"phone": phone, "code": "1234"})
+    assert r.status_code == 400
+    assert r.json()["detail"]["error"] == "expired"
+    assert db.get_otp(phone) is None
+
+
+def test_sweeper_removes_codes_past_grace():
+    now = time.time()
+    old, resent, fresh = "+998908880002", "+998908880003", "+998908880004"
+    db.save_otp(old, "1111", now - db.OTP_SWEEP_GRACE - 5)
+    db.save_otp(resent, "2222", now - db.OTP_SWEEP_GRACE - 5)
+    db.save_otp(resent, "3333", now + 300)  # qayta yuborilgan: heap’dagi eski yozuv e’tiborsiz
+    db.save_otp(fresh, "4444", now + 300)
+
+    assert db._otp_sweep() >= 1
+    assert db.get_otp(old) is None
+    assert db.get_otp(resent)["code"] == "3333"
+    assert db.get_otp(fresh)["code"] == "4444"
+
+
+def test_valid_code_verifies_and_is_deleted():
+    phone = "+998908880005"
+    db.save_registered_user(phone, "Otp", "Test")
+    db.save_otp(phone, "5555", time.time() + 300)
+    r = client.post("/api/otp/verify", json={"phone": phone, "code": "5555"})
+    assert r.status_code == 200, r.text
+    assert db.get_otp(phone) is None
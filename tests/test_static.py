@@ -0,0 +1,42 @@
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import uploads
+
+
+@pytest.fixture(scope="module")
+def asset():
+    body = b"\x89PNG\r\n\x1a\n" + b"\x00\x01" * 5000
+    path = uploads.UPLOADS_ROOT / "menu" / ("e" * 32 + ".png")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(body)
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(body))
+    yield f"/static/menu/{path.name}", body
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=0, *", None),
+    ("*", "gzip"),
+    ("identity", None),
+    ("", None),
+])
+def test_sidecar_negotiation(asset, accept, expected):
+    url, body = asset
+    with TestClient(main.app) as c:
+        r = c.get(url, headers={"accept-encoding": accept})
+    assert r.headers.get("content-encoding") == expected
+    assert r.content == body
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert "immutable" in r.headers["cache-control"]
+
+
+def test_pick_encoding_q_values():
+    assert uploads.pick_encoding("br;q=0, gzip", ("br", "gzip")) == "gzip"
+    assert uploads.pick_encoding("br;q=0.5, gzip;q=0", ("br", "gzip")) == "br"
+    assert uploads.pick_encoding(None, ("br", "gzip")) is None
@@ -0,0 +1,22 @@
+import database as db
+
+
+def test_lookup_by_chat_id():
+    db.save_telegram_user("+998901000001", 5001, "ali", "Ali")
+    assert db.get_telegram_user_by_chat_id(5001)["phone"] == "+998901000001"
+    assert db.get_telegram_user_by_chat_id("5001")["username"] == "ali"
+    assert db.get_telegram_user_by_chat_id(5999) is None
+
+
+def test_moved_chat_id_is_reindexed():
+    db.save_telegram_user("+998901000002", 5002)
+    db.save_telegram_user("+998901000002", 5003)
+    assert db.get_telegram_user_by_chat_id(5003)["phone"] == "+998901000002"
+    assert db.get_telegram_user_by_chat_id(5002) is None
+
+
+def test_shared_chat_id_returns_first_record():
+    db.save_telegram_user("+998901000003", 5004)
+    db.save_telegram_user("+998901000004", 5004)
+    assert db.get_telegram_user_by_chat_id(5004)["phone"] == "+998901000003"
+    assert db.get_telegram_user("+998901000004")["chat_id"] == "5004"
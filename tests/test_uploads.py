@@ -0,0 +1,64 @@
+import io
+import os
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+import uploads
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+@pytest.fixture(autouse=True)
+def uploads_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOADS_ROOT", tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize("limit, text", [
+    (512 * 1024, "512 KB"),
+    (1536 * 1024, "1.5 MB"),
+    (10 * 1024 * 1024, "10.0 MB"),
+])
+def test_oversize_reports_real_limit(monkeypatch, uploads_root, limit, text):
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", limit)
+    with pytest.raises(HTTPException) as e:
+        uploads._store(io.BytesIO(PNG + b"\x00" * limit), "menu")
+    assert e.value.status_code == 413
+    assert e.value.detail == f"Image is larger than {text}"
+    assert not list((uploads_root / "menu").iterdir())  # vaqtinchalik fayl qolmadi
+
+
+@pytest.mark.parametrize("data", [b"GIF90a" + b"\x00" * 16, b"<svg xmlns=...>", b"%PDF-1.7"])
+def test_wrong_magic_bytes_is_415(uploads_root, data):
+    with pytest.raises(HTTPException) as e:
+        uploads._store(io.BytesIO(data), "menu")
+    assert e.value.status_code == 415
+    assert not list((uploads_root / "menu").iterdir())
+
+
+def test_wrong_magic_bytes_via_endpoint_is_415():
+    r = TestClient(main.app).post(
+        "/api/menu/foods",
+        data={"name": "X", "price": "1", "category": "uploads-test"},
+        files={"image": ("photo.png", b"not really a png", "image/png")},  # nom va turiga ishonilmaydi
+        headers={"X-Admin-Key": "test-key"},
+    )
+    assert r.status_code == 415, r.text
+
+
+def test_identical_content_is_stored_once(uploads_root):
+    first = uploads._store(io.BytesIO(PNG), "menu")
+    path = uploads_root / "menu" / first.rsplit("/", 1)[1]
+    old = path.stat().st_mtime - 7200
+    os.utime(path, (old, old))
+
+    second = uploads._store(io.BytesIO(PNG), "menu")
+    assert second == first
+    assert [p.name for p in (uploads_root / "menu").iterdir() if not p.name.endswith((".gz", ".br"))] == [path.name]
+    assert path.stat().st_mtime > old  # GC grace qaytadan boshlanadi
+
+    other = uploads._store(io.BytesIO(PNG + b"\x01"), "menu")
+    assert other != first
@@ -0,0 +1,88 @@
+import os
+import time
+
+import pytest
+
+import database as db
+import uploads
+
+
+@pytest.fixture(autouse=True)
+def uploads_root(tmp_path, monkeypatch):
+    """Har test o‘z uploads/ papkasida — boshqa testlarning fayllari hisobotga aralashmasin."""
+    monkeypatch.setattr(uploads, "UPLOADS_ROOT", tmp_path)
+    monkeypatch.setattr(uploads, "GC_ROOT", tmp_path / "menu")
+    return tmp_path
+
+
+@pytest.fixture
+def no_grace(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_GC_GRACE", 0)
+
+
+def _touch(path, data=b"x", age=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if age:
+        t = time.time() - age
+        os.utime(path, (t, t))
+    return path
+
+
+def test_gc_only_touches_menu_folder(no_grace):
+    root = uploads.UPLOADS_ROOT
+    outside = [
+        _touch(root / "ad"),
+        _touch(root / "banners" / "promo.jpg"),
+        _touch(root / ("f" * 32 + ".png")),
+    ]
+    orphan = _touch(root / "menu" / ("a" * 32 + ".png"))
+    orphan_side = _touch(root / "menu" / ("a" * 32 + "_thumb.webp"))
+
+    report = uploads.collect_garbage(dry_run=False)
+
+    assert all(p.exists() for p in outside)
+    assert not orphan.exists() and not orphan_side.exists()
+    assert {o["path"] for o in report["orphans"]} == {
+        f"menu/{'a' * 32}.png", f"menu/{'a' * 32}_thumb.webp",
+    }
+
+
+def test_gc_keeps_referenced_and_recent(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_GC_GRACE", 3600)
+    root = uploads.UPLOADS_ROOT / "menu"
+    used = _touch(root / ("b" * 32 + ".jpg"), age=7200)
+    used_variant = _touch(root / ("b" * 32 + "_card.webp"), age=7200)
+    fresh = _touch(root / ("c" * 32 + ".jpg"))
+    old = _touch(root / ("d" * 32 + ".jpg"), age=7200)
+    food = db.menu_create_food({"name": "Test", "price": 1, "category": "gc", "image": f"/static/menu/{used.name}"})
+    try:
+        dry = uploads.collect_garbage(dry_run=True)
+        assert old.exists() and dry["deleted"] == 0
+        assert f"menu/{old.name}" in {o["path"] for o in dry["orphans"]}
+
+        uploads.collect_garbage(dry_run=False)
+        assert used.exists() and used_variant.exists() and fresh.exists()
+        assert not old.exists()
+    finally:
+        db.menu_delete_food(food["id"])
+
+
+def test_gc_pages_through_groups_in_batches(no_grace):
+    root = uploads.UPLOADS_ROOT / "menu"
+    names = [ch * 32 + ".png" for ch in "01234"]
+    for n in names:
+        _touch(root / n)
+        _touch(root / (n + ".gz"))
+
+    first = uploads.collect_garbage(dry_run=False, limit=2)
+    assert first["groups"] == 2 and first["deleted"] == 4
+    assert len(list(root.iterdir())) == 6  # qolgan guruhlarga hali tegilmagan
+
+    after, calls = first["next"], 1
+    while after is not None:
+        report = uploads.collect_garbage(dry_run=False, after=after, limit=2)
+        calls += 1
+        after = report["next"]
+    assert calls == 3
+    assert not list(root.iterdir())
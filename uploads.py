@@ -0,0 +1,446 @@
+"""
+uploads.py — admin yuklaydigan rasmlar (taom / kategoriya) uchun umumiy pipeline
+
+✅ Oqim bilan yoziladi: fayl bo‘lak-bo‘lak (UPLOAD_CHUNK) o‘qiladi, butuni xotiraga olinmaydi,
+  nusxalash event loopdan tashqarida (thread) bajariladi
+✅ Cheklovlar: UPLOAD_MAX_MB dan katta fayl → 413, rasm bo‘lmasa (magic bytes bo‘yicha) → 415
+✅ Fayl nomi = sha256(kontent): bir xil rasm qayta yuklansa yangi joy egallamaydi
+✅ /static: hash nomli fayllar `Cache-Control: immutable` bilan, .gz / .br yonfayllari
+  (yuklashda tayyorlanadi, foyda bo‘lsagina) Accept-Encoding bo‘yicha beriladi
+✅ Yetim fayllar GC: menyuda havolasi qolmagan rasm (variant, yonfayllari bilan) fonda
+  batch’lab o‘chiriladi; /api/admin/uploads/gc?dry_run=true&after=<next> — faqat hisobot
+✅ Yuklangandan keyin fonda (ProcessPool) thumb / card / full + WebP variantlar yasaladi,
+  tayyor bo‘lgach taom/kategoriya yozuviga image_variants qo‘shiladi (Pillow bo‘lmasa — o‘tkaziladi)
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from mimetypes import guess_type
+from multiprocessing import get_context
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:  # ixtiyoriy — bo‘lmasa faqat gzip
+    brotli = None
+
+import database as db
+import imaging
+
+
+# ═══════════════════════════════════════════════════════════════
+#  SOZLAMALAR
+# ═══════════════════════════════════════════════════════════════
+
+UPLOADS_ROOT = db.DATA_DIR / "uploads"
+STATIC_PREFIX = "/static"
+
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "10")) * 1024 * 1024)
+UPLOAD_CHUNK = 64 * 1024
+
+# yonfayl (.gz/.br) faqat kamida shuncha kichik bo‘lsa saqlanadi
+SIDECAR_MIN_SAVING = 0.1
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+GC_ROOT = UPLOADS_ROOT / "menu"   # GC faqat menyu rasmlariga tegadi (bannerlar va h.k. emas)
+UPLOAD_GC_INTERVAL = float(os.getenv("UPLOAD_GC_INTERVAL", "21600"))  # 0 — fon GC o‘chiq
+UPLOAD_GC_GRACE = float(os.getenv("UPLOAD_GC_GRACE", "3600"))       # yangi fayllarga tegilmaydi
+UPLOAD_GC_BATCH = 200                                               # bir qadamda tekshiriladigan guruhlar
+UPLOAD_GC_STEP = 1.0                                                # fon GC qadamlari orasidagi pauza (s)
+
+IMAGE_WORKERS = max(1, int(os.getenv("IMAGE_WORKERS", "1")))
+
+# kontent boshidagi baytlar → kengaytma (admin yuborgan nom/Content-Type ga ishonmaymiz)
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+def _sniff(head: bytes) -> str | None:
+    for magic, ext in _SIGNATURES:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+# ═══════════════════════════════════════════════════════════════
+#  SAQLASH
+# ═══════════════════════════════════════════════════════════════
+
+def _size_text(n: int) -> str:
+    """Baytlar → "1.5 MB" / "512 KB" (1 MB dan kichik limit "0 MB" bo‘lib chiqmasin)."""
+    if n >= 1024 * 1024:
+        return f"{n / (1024 * 1024):.1f} MB"
+    return f"{n / 1024:.0f} KB"
+
+
+def _store(src, subdir: str) -> str:
+    """
+    src (fayl obyekti) → UPLOADS_ROOT/subdir/<sha256>.<ext>, URL qaytaradi.
+    Vaqtinchalik faylga yozib, oxirida hash nomiga os.replace qilinadi.
+    """
+    folder = UPLOADS_ROOT / subdir
+    folder.mkdir(parents=True, exist_ok=True)
+    tmp = folder / f".upload-{uuid.uuid4().hex}.tmp"
+
+    h = hashlib.sha256()
+    size = 0
+    ext = None
+    try:
+        with tmp.open("wb") as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                if ext is None:
+                    ext = _sniff(chunk)
+                    if ext is None:
+                        raise HTTPException(415, "Unsupported image type (jpg, png, gif, webp)")
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(413, f"Image is larger than {_size_text(UPLOAD_MAX_BYTES)}")
+                h.update(chunk)
+                out.write(chunk)
+        if ext is None:
+            raise HTTPException(400, "Empty image")
+
+        name = f"{h.hexdigest()[:32]}{ext}"
+        dest = folder / name
+        if dest.exists():
+            tmp.unlink()           # shu rasm allaqachon bor (yonfayllari ham)
+            os.utime(dest)         # GC uni hozirgina yetim deb o‘chirib yubormasin
+        else:
+            tmp.replace(dest)
+            _precompress(dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    return f"{STATIC_PREFIX}/{Path(subdir, name).as_posix()}"
+
+
+def _precompress(path: Path) -> None:
+    """
+    path.gz va path.br (brotli bo‘lsa) yonfayllarini yozadi — siqish kamida
+    SIDECAR_MIN_SAVING foyda bersagina. Avval boshidagi bo‘lak sinab ko‘riladi:
+    jpg/png/webp kabi allaqachon siqilgan rasmlar uchun deyarli bepul o‘tkaziladi.
+    """
+    limit = path.stat().st_size * (1 - SIDECAR_MIN_SAVING)
+    with path.open("rb") as f:
+        head = f.read(UPLOAD_CHUNK)
+    if len(zlib.compress(head, 6)) > len(head) * (1 - SIDECAR_MIN_SAVING):
+        return
+
+    encoders = [(".gz", lambda: zlib.compressobj(9, zlib.DEFLATED, 31))]
+    if brotli is not None:
+        encoders.append((".br", lambda: brotli.Compressor(quality=11)))
+    for suffix, make in encoders:
+        side = path.with_name(path.name + suffix)
+        tmp = path.with_name(f".{side.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            enc = make()
+            with path.open("rb") as src, tmp.open("wb") as out:
+                while chunk := src.read(UPLOAD_CHUNK):
+                    out.write(enc.compress(chunk) if suffix == ".gz" else enc.process(chunk))
+                out.write(enc.flush() if suffix == ".gz" else enc.finish())
+            if tmp.stat().st_size <= limit:
+                tmp.replace(side)
+            else:
+                tmp.unlink()
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            print(f"⚠️ {side.name}: yozilmadi: {e}")
+
+
+async def save_image(image: UploadFile, subdir: str) -> str:
+    """UploadFile ni subdir ga saqlaydi (event loopni bloklamaydi), /static/... URL qaytaradi."""
+    await image.seek(0)
+    return await asyncio.to_thread(_store, image.file, subdir)
+
+
+def _path_of(url: str) -> Path | None:
+    """/static/... URL → UPLOADS_ROOT ichidagi fayl (emoji yoki begona URL bo‘lsa None)."""
+    if not url or not url.startswith(STATIC_PREFIX + "/"):
+        return None
+    path = (UPLOADS_ROOT / url[len(STATIC_PREFIX) + 1:]).resolve()
+    return path if path.is_relative_to(UPLOADS_ROOT.resolve()) and path.is_file() else None
+
+
+# ═══════════════════════════════════════════════════════════════
+#  VARIANTLAR (fon, ProcessPool)
+# ═══════════════════════════════════════════════════════════════
+
+_pool: ProcessPoolExecutor | None = None
+_tasks: set[asyncio.Task] = set()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn — fork qilingan bolaga event loop / lock holatlari o‘tib qolmasin
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=get_context("spawn"))
+    return _pool
+
+
+async def _build_variants(url: str) -> None:
+    path = _path_of(url)
+    if path is None:
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        made = await loop.run_in_executor(_get_pool(), imaging.make_variants, str(path))
+    except Exception as e:
+        print(f"⚠️ {path.name}: variantlar yasalmadi: {e}")
+        return
+    base = url.rsplit("/", 1)[0]
+    variants = {
+        name: {"url": f"{base}/{v['file']}", "webp": f"{base}/{v['webp']}",
+               "width": v["width"], "height": v["height"]}
+        for name, v in made.items()
+    }
+    await db.aio.menu_attach_image_variants(url, variants)
+
+
+def schedule_variants(url: str) -> None:
+    """Yozuv saqlangandan keyin chaqiriladi; javobni kutdirmaydi."""
+    if not imaging.AVAILABLE or _path_of(url) is None:
+        return
+    task = asyncio.create_task(_build_variants(url))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  YETIM FAYLLAR GC
+# ═══════════════════════════════════════════════════════════════
+#
+# Egasi (owner) — hash nomli fayllar uchun 32 belgili hash: <h>.png, <h>_card.jpg,
+# <h>_card.webp, <h>.png.gz hammasi bitta guruh. Boshqa nomlar — yonfayl qo‘shimchasisiz nom.
+# Guruh menyudagi hech bir image / image_url / image_variants da uchramasa va
+# guruhdagi eng yangi fayl UPLOAD_GC_GRACE dan eski bo‘lsa — butunlay o‘chiriladi.
+# Faqat GC_ROOT (uploads/menu) ko‘riladi — boshqa /static fayllari menyuga tegishli emas.
+#
+# Inkremental: guruhlar owner bo‘yicha tartiblanadi, har chaqiruv `after` dan keyingi
+# ko‘pi bilan `limit` ta guruhni stat qilib tekshiradi va keyingi pozitsiyani qaytaradi.
+# Fon GC pozitsiyani (_gc_position) qadamlar orasida saqlaydi: har UPLOAD_GC_STEP da bitta
+# batch, aylanish tugagach UPLOAD_GC_INTERVAL kutadi. Menyu havolalari menu_version
+# o‘zgarmaguncha qayta o‘qilmaydi.
+
+_gc_task: asyncio.Task | None = None
+_gc_position = ""                               # fon GC: oxirgi tekshirilgan owner
+_gc_refs: tuple[int, set[str]] | None = None    # (menu_version, havola qilingan owner’lar)
+
+
+def _owner(rel: str) -> str:
+    folder, _, name = rel.rpartition("/")
+    for suffix in (".gz", ".br"):
+        name = name.removesuffix(suffix)
+    if _HASHED_NAME.match(name):
+        name = name[:32]
+    return f"{folder}/{name}" if folder else name
+
+
+def _referenced_owners() -> set[str]:
+    global _gc_refs
+    version = db.menu_version()
+    if _gc_refs is not None and _gc_refs[0] == version:
+        return _gc_refs[1]
+    urls = []
+    for item in db.menu_get_foods() + db.menu_get_categories():
+        urls.append(item.get("image") or "")
+        urls.append(item.get("image_url") or "")
+        for v in (item.get("image_variants") or {}).values():
+            urls += [v.get("url") or "", v.get("webp") or ""]
+    prefix = STATIC_PREFIX + "/"
+    owners = {_owner(u[len(prefix):]) for u in urls if u.startswith(prefix)}
+    _gc_refs = (version, owners)
+    return owners
+
+
+def _list_groups() -> dict[str, list[Path]]:
+    """GC_ROOT dagi fayllar owner bo‘yicha — faqat nomlar (stat qilinmaydi)."""
+    groups: dict[str, list[Path]] = {}
+    stack = [GC_ROOT] if GC_ROOT.is_dir() else []
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                    continue
+                rel = Path(entry.path).relative_to(UPLOADS_ROOT).as_posix()
+                groups.setdefault(_owner(rel), []).append(Path(entry.path))
+    return groups
+
+
+def collect_garbage(dry_run: bool = True, after: str = "", limit: int = UPLOAD_GC_BATCH) -> dict:
+    """
+    uploads/menu dagi `after` dan keyingi ko‘pi bilan limit ta guruhni menyu yozuvlari bilan
+    solishtiradi; dry_run=False bo‘lsa yetimlarni o‘chiradi. "next" — keyingi chaqiruvning
+    `after` i (None — oxiriga yetildi). Vaqtinchalik (.tmp) qoldiqlar ham grace’dan keyin yetim.
+    """
+    started = time.perf_counter()
+    referenced = _referenced_owners()
+    now = time.time()
+
+    groups = _list_groups()
+    owners = sorted(o for o in groups if o > after)
+    batch, rest = owners[:limit], owners[limit:]
+
+    orphans, freed, deleted, scanned = [], 0, 0, 0
+    for owner in batch:
+        scanned += len(groups[owner])
+        if owner in referenced:
+            continue
+        files = []
+        for path in groups[owner]:
+            try:
+                files.append((path, path.stat()))
+            except FileNotFoundError:
+                pass
+        if not files:
+            continue
+        newest = max(st.st_mtime for _, st in files)
+        if now - newest < UPLOAD_GC_GRACE:
+            continue
+        for path, st in files:
+            orphans.append({
+                "path": path.relative_to(UPLOADS_ROOT).as_posix(),
+                "size": st.st_size,
+                "age_hours": round((now - st.st_mtime) / 3600, 1),
+            })
+            freed += st.st_size
+        if dry_run:
+            continue
+        # oxirgi tekshiruv: shu orada qayta yuklangan bo‘lsa (_store utime qiladi) tegmaymiz
+        if any(now - p.stat().st_mtime < UPLOAD_GC_GRACE for p, _ in files if p.exists()):
+            continue
+        for path, _ in files:
+            path.unlink(missing_ok=True)
+            deleted += 1
+
+    return {
+        "dry_run": dry_run,
+        "scanned": scanned,
+        "groups": len(batch),
+        "referenced": len(referenced),
+        "orphans": orphans,
+        "orphan_bytes": freed,
+        "deleted": deleted,
+        "next": batch[-1] if rest else None,
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+async def _gc_loop() -> None:
+    global _gc_position
+    while True:
+        # aylanish o‘rtasida — keyingi batch qisqa pauzadan keyin, tugagan bo‘lsa interval
+        await asyncio.sleep(UPLOAD_GC_STEP if _gc_position else UPLOAD_GC_INTERVAL)
+        leader = db.try_acquire_leadership("upload_gc")  # bir nechta workerdan bittasi
+        if leader is None:
+            continue
+        try:
+            report = await asyncio.to_thread(collect_garbage, False, _gc_position)
+            _gc_position = report["next"] or ""
+            if report["deleted"]:
+                print(f"🧹 uploads GC: {report['deleted']} ta fayl o‘chirildi ({report['orphan_bytes']} bayt)")
+        except Exception as e:
+            print(f"uploads GC xato: {e}")
+        finally:
+            leader.close()
+
+
+def start_gc() -> None:
+    global _gc_task
+    if UPLOAD_GC_INTERVAL > 0 and _gc_task is None:
+        _gc_task = asyncio.create_task(_gc_loop())
+
+
+async def shutdown() -> None:
+    """lifespan oxirida: GC ni to‘xtatadi, boshlangan variantlarni kutib, poolni yopadi."""
+    global _pool, _gc_task
+    if _gc_task is not None:
+        _gc_task.cancel()
+        _gc_task = None
+    if _tasks:
+        await asyncio.gather(*_tasks, return_exceptions=True)
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+
+# ═══════════════════════════════════════════════════════════════
+#  /static — immutable + oldindan siqilgan yonfayllar
+# ═══════════════════════════════════════════════════════════════
+
+def pick_encoding(accept_encoding: str | None, available) -> str | None:
+    """
+    Accept-Encoding → available (afzallik tartibida) ichidan mijoz qabul qiladigan birinchisi.
+    q=0 — rad etilgan; "*" ro‘yxatda yo‘q kodlashlarga tegishli. main.py javob siqishi ham shuni ishlatadi.
+    """
+    offered = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip().removeprefix("q=")
+        try:
+            offered[name.strip()] = float(q) if q else 1.0
+        except ValueError:
+            offered[name.strip()] = 1.0
+    for coding in available:
+        if offered.get(coding, offered.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+# <sha256[:32]>.ext va undan yasalgan variantlar — kontent o‘zgarsa nom ham o‘zgaradi
+_HASHED_NAME = re.compile(r"^[0-9a-f]{32}(_[a-z]+)?\.[a-z0-9]+$")
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles + hash nomli fayllarga uzoq muddatli immutable kesh,
+    mijoz qabul qilsa .br / .gz yonfaylini Content-Encoding bilan beradi.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        accept = request_headers.get("accept-encoding")
+        media_type = guess_type(str(full_path))[0] or "text/plain"
+
+        sides = []  # mavjud yonfayllar, afzallik tartibida
+        for suffix, coding in ((".br", "br"), (".gz", "gzip")):
+            try:
+                sides.append((f"{full_path}{suffix}", coding, os.stat(f"{full_path}{suffix}")))
+            except OSError:
+                pass
+        coding = pick_encoding(accept, [c for _, c, _ in sides])
+        if coding:
+            side, _, side_stat = next(x for x in sides if x[1] == coding)
+            response = FileResponse(side, status_code=status_code, stat_result=side_stat,
+                                    media_type=media_type, headers={"Content-Encoding": coding})
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if sides:
+            response.headers["Vary"] = "Accept-Encoding"
+        if _HASHED_NAME.match(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response